@@ -1,5 +1,8 @@
-from flask import Flask
-from config import SECRET_KEY, FIXED_SLOTS
+import logging
+from flask import Flask, request
+from config import SECRET_KEY, FIXED_SLOTS, DB_STATS_HEADER, DB_READ_YOUR_WRITES_SECONDS
+from db import start_request_stats, request_stats, mark_write, last_write
+from utils import minutes_to_hhmm
 from models import init_db
 from routes.auth import auth_bp
 from routes.admin import admin_bp
@@ -8,11 +11,43 @@ from routes.export import export_bp
 
 app = Flask(__name__)
 app.secret_key = SECRET_KEY
+app.add_template_filter(minutes_to_hhmm, 'hhmm')
 app.register_blueprint(auth_bp)
 app.register_blueprint(admin_bp)
 app.register_blueprint(teacher_bp)
 app.register_blueprint(export_bp)
 
+LAST_WRITE_COOKIE = 'db_last_write'
+
+@app.before_request
+def _start_db_stats():
+    start_request_stats()
+    # Read-your-writes follows the browser session, whichever worker served its last write
+    try:
+        mark_write(float(request.cookies.get(LAST_WRITE_COOKIE, 0)))
+    except ValueError:
+        mark_write(0.0)
+
+@app.after_request
+def _remember_last_write(response):
+    written = last_write()
+    if written and str(written) != request.cookies.get(LAST_WRITE_COOKIE):
+        response.set_cookie(LAST_WRITE_COOKIE, str(written), max_age=max(DB_READ_YOUR_WRITES_SECONDS, 1),
+                            httponly=True, samesite='Lax')
+    return response
+
+@app.after_request
+def _report_db_stats(response):
+    stats = request_stats()
+    if stats is not None:
+        summary = (f"queries={stats['queries']}; db_ms={stats['db_ms']:.1f}; "
+                   f"connections={stats['connections']}; slow={stats['slow']}")
+        if DB_STATS_HEADER:
+            response.headers['X-DB-Stats'] = summary
+        app.logger.info("%s %s %s", request.method, request.path, summary)
+    return response
+
 if __name__=='__main__':
+    logging.basicConfig(level=logging.INFO)
     init_db()
     app.run(debug=True,host='0.0.0.0',port=5000)
@@ -0,0 +1,122 @@
+import logging
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from config import CACHE_BACKEND, CACHE_URL, CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+log = logging.getLogger(__name__)
+
+EPOCH_KEY = 'timetable:epoch'
+
+
+class MemoryBackend:
+    """
+    In-process LRU with per-entry TTL:
+    - Least recently used entry is evicted past `max_entries`
+    - Expired entries are dropped on read
+    Each web worker has its own copy; use the redis backend to share across workers.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            if item[0] < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return item[1]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def counter(self, key):
+        with self._lock:
+            return self._counters.get(key, 0)
+
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            # Entries of older epochs can never be read again
+            self._data.clear()
+            return self._counters[key]
+
+
+class RedisBackend:
+    """
+    Shared cache for several gunicorn workers (needs the optional `redis` package):
+    - Values are pickled, TTL via SETEX
+    - LRU eviction is redis' own (maxmemory-policy allkeys-lru)
+    """
+
+    def __init__(self, url):
+        if redis is None:
+            raise Exception("CACHE_BACKEND=redis needs the redis package installed")
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        raw = self._client.get(key)
+        return pickle.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl):
+        self._client.setex(key, int(ttl), pickle.dumps(value))
+
+    def counter(self, key):
+        return int(self._client.get(key) or 0)
+
+    def incr(self, key):
+        return self._client.incr(key)
+
+
+def _make_backend():
+    if CACHE_BACKEND == 'redis':
+        return RedisBackend(CACHE_URL)
+    return MemoryBackend(CACHE_MAX_ENTRIES)
+
+backend = _make_backend()
+
+def read_through(key, loader, ttl=None):
+    """
+    Return the cached value for `key`, or call loader() and cache its result.
+    Keys are scoped by the invalidation epoch, so invalidate_timetables() drops everything at once.
+    Callers must not mutate the returned value.
+    """
+    if CACHE_TTL_SECONDS <= 0:
+        return loader()
+    try:
+        key = f"timetable:{backend.counter(EPOCH_KEY)}:{key}"
+        value = backend.get(key)
+    except Exception as e:
+        log.warning("Cache read failed, loading from the database: %s", e)
+        return loader()
+    if value is None:
+        value = loader()
+        try:
+            backend.set(key, value, ttl or CACHE_TTL_SECONDS)
+        except Exception as e:
+            log.warning("Cache write failed: %s", e)
+    return value
+
+def invalidate_timetables():
+    """Call after publishing a timetable or renaming/deleting anything a timetable view shows."""
+    try:
+        backend.incr(EPOCH_KEY)
+    except Exception as e:
+        log.warning("Cache invalidation failed: %s", e)
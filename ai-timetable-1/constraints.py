@@ -0,0 +1,137 @@
+import threading
+import time
+from typing import NamedTuple
+from config import CONSTRAINT_CACHE_SECONDS
+from occupancy import Occupancy, load_teacher_availability
+
+
+class CourseConstraints(NamedTuple):
+    """
+    Everything the generators need for one course:
+    - sections: section ids
+    - subjects: subject rows (id, name, course_id, is_lab, default_duration_minutes)
+    - teacher_map: (subject_id, section_id) -> teacher ids assigned to that section, in assignment order
+      (an assignment without a section covers every section of the course)
+    - availability: Occupancy with only blocked minutes and weekly limits set (read-only, copy() before use)
+    """
+    course_id: int
+    sections: list
+    subjects: list
+    teacher_map: dict
+    availability: Occupancy
+
+    def teacher_ids(self):
+        return sorted({tid for tids in self.teacher_map.values() for tid in tids})
+
+    def check(self):
+        """Raise if the course cannot be scheduled at all."""
+        if not self.sections:
+            raise Exception("No sections found")
+        if not self.subjects:
+            raise Exception("No subjects found")
+        for subj in self.subjects:
+            for section_id in self.sections:
+                if not self.teacher_map[(subj['id'], section_id)]:
+                    raise Exception(f"No teachers assigned to subject {subj['name']} in section {section_id}")
+        return self
+
+
+# course_id -> (loaded_at, CourseConstraints); per process, cleared by the admin CRUD routes
+_cache = {}
+_cache_lock = threading.Lock()
+
+def load_constraints(cur, course_ids, use_cache=True):
+    """
+    Constraint models for several courses in three queries, whatever their size:
+    - sections of all courses
+    - subjects LEFT JOIN teacher_subjects (subjects and per-section teacher map together)
+    - teacher availability and weekly hours (load_teacher_availability)
+    With CONSTRAINT_CACHE_SECONDS > 0 (single-process deployments only), cached models younger
+    than that are reused without touching the database.
+    Returns {course_id: CourseConstraints}; call .check() before scheduling.
+    """
+    course_ids = sorted(set(course_ids))
+    found, missing = {}, []
+    now = time.monotonic()
+    with _cache_lock:
+        for course_id in course_ids:
+            hit = _cache.get(course_id) if use_cache else None
+            if hit and now - hit[0] < CONSTRAINT_CACHE_SECONDS:
+                found[course_id] = hit[1]
+            else:
+                missing.append(course_id)
+    if not missing:
+        return found
+
+    placeholders = ','.join(['%s'] * len(missing))
+    sections = {c: [] for c in missing}
+    cur.execute(f'SELECT id, course_id FROM sections WHERE course_id IN ({placeholders}) ORDER BY id',
+                tuple(missing))
+    for r in cur.fetchall():
+        sections[r['course_id']].append(r['id'])
+
+    subjects = {c: [] for c in missing}
+    teacher_map = {c: {} for c in missing}
+    cur.execute(
+        'SELECT s.id, s.name, s.course_id, s.is_lab, s.default_duration_minutes, '
+        'ts.teacher_id, ts.section_id AS assigned_section '
+        'FROM subjects s '
+        'LEFT JOIN teacher_subjects ts ON ts.subject_id=s.id '
+        f'WHERE s.course_id IN ({placeholders}) '
+        'ORDER BY s.id',
+        tuple(missing)
+    )
+    seen = set()
+    for r in cur.fetchall():
+        course_sections = sections[r['course_id']]
+        tmap = teacher_map[r['course_id']]
+        if r['id'] not in seen:
+            seen.add(r['id'])
+            for section_id in course_sections:
+                tmap[(r['id'], section_id)] = []
+            subjects[r['course_id']].append({k: r[k] for k in ('id', 'name', 'course_id', 'is_lab',
+                                                               'default_duration_minutes')})
+        if r['teacher_id'] is None:
+            continue
+        # NULL section_id: the teacher takes the subject in every section of the course
+        covered = course_sections if r['assigned_section'] is None else [r['assigned_section']]
+        for section_id in covered:
+            tids = tmap.get((r['id'], section_id))
+            if tids is not None and r['teacher_id'] not in tids:
+                tids.append(r['teacher_id'])
+
+    all_teachers = {tid for tmap in teacher_map.values() for tids in tmap.values() for tid in tids}
+    availability = load_teacher_availability(cur, all_teachers)
+
+    loaded_at = time.monotonic()
+    with _cache_lock:
+        for course_id in missing:
+            model = CourseConstraints(course_id, sections[course_id], subjects[course_id],
+                                      teacher_map[course_id], Occupancy())
+            teachers = set(model.teacher_ids())
+            model.availability.blocked = {k: v for k, v in availability.blocked.items() if k[0] in teachers}
+            model.availability.limit = {k: v for k, v in availability.limit.items() if k in teachers}
+            found[course_id] = model
+            if use_cache and CONSTRAINT_CACHE_SECONDS > 0:
+                _cache[course_id] = (loaded_at, model)
+    return found
+
+def course_constraints(cur, course_id, use_cache=True):
+    """Checked constraint model for a single course."""
+    return load_constraints(cur, [course_id], use_cache=use_cache)[course_id].check()
+
+def merged_availability(models):
+    """One Occupancy with the availability of every given course (for cross-course solving)."""
+    merged = Occupancy()
+    for model in models:
+        merged.blocked.update(model.availability.blocked)
+        merged.limit.update(model.availability.limit)
+    return merged
+
+def invalidate_constraints(course_id=None):
+    """Drop the cached model of one course, or of every course when course_id is None."""
+    with _cache_lock:
+        if course_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(course_id, None)
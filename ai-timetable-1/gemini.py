@@ -1,8 +1,32 @@
+import asyncio
 import json
 import io
 import pandas as pd
-from config import GEMINI_MODEL
-from utils import sanitize_constraints
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter
+from functools import lru_cache
+from typing import NamedTuple
+from config import GEMINI_MODEL, GEMINI_SHARD_SECTIONS, GEMINI_CONCURRENCY, GEMINI_TOKEN_BUDGET, LUNCH_BREAK
+from utils import time_to_minutes
+from slots import GRID
+from occupancy import Occupancy
+from gemini_cache import fingerprint, response_cache
+
+# Bump whenever build_prompt_from_constraints changes what Gemini is asked; cached results of older prompts are never reused
+PROMPT_VERSION = 3
+
+# Estimated completion tokens per timetable entry in the compact output format
+ENTRY_TOKENS = 14
+
+# Streaming generation reports progress every this many accepted entries
+STREAM_PROGRESS_EVERY = 20
+
+def _response_text(resp):
+    # Extract text safely from response
+    text = getattr(resp, 'text', None)
+    if not text and isinstance(resp, dict):
+        text = resp.get('text', str(resp))
+    return text or None
 
 def call_gemini(prompt: str):
     """
@@ -12,16 +36,163 @@ def call_gemini(prompt: str):
     if not GEMINI_MODEL:
         return None
     try:
-        resp = GEMINI_MODEL.generate_content(contents=prompt)
-        # Extract text safely from response
-        text = getattr(resp, 'text', None)
-        if not text and isinstance(resp, dict):
-            text = resp.get('text', str(resp))
-        return text or None
+        return _response_text(GEMINI_MODEL.generate_content(contents=prompt))
     except Exception as e:
         print(f"[Gemini] Error: {e}")
         return None
 
+async def stream_gemini(prompt: str):
+    """
+    Yield the completion as text chunks while the model produces it.
+    Uses the SDK's synchronous streaming call, each blocking step in a worker thread: its async
+    client is bound to the event loop it was first used on, and every generation runs its own loop.
+    An error ends the stream; chunks already yielded stay valid.
+    """
+    if not GEMINI_MODEL:
+        return
+    try:
+        chunks = iter(await asyncio.to_thread(GEMINI_MODEL.generate_content, contents=prompt, stream=True))
+        while True:
+            chunk = await asyncio.to_thread(next, chunks, None)
+            if chunk is None:
+                break
+            text = _response_text(chunk)
+            if text:
+                yield text
+    except Exception as e:
+        print(f"[Gemini] Error: {e}")
+
+def _cache_key(constraints, fixed_slots, lab_blocks):
+    model_name = getattr(GEMINI_MODEL, 'model_name', '')
+    return fingerprint(constraints, PROMPT_VERSION, model_name, extra=[fixed_slots, lab_blocks])
+
+def _cache_get(key):
+    try:
+        return response_cache.get(key)
+    except Exception as e:
+        print(f"[Gemini] Cache error: {e}")
+        return None
+
+def _cache_set(key, entries):
+    if not entries:
+        return
+    try:
+        response_cache.set(key, entries)
+    except Exception as e:
+        print(f"[Gemini] Cache error: {e}")
+
+def shard_constraints(constraints: dict, shard_size=None, budget=None, fixed_slots=None, lab_blocks=None):
+    """
+    Split course constraints by section: each shard has up to `shard_size` sections,
+    the full subject list and the teacher map of its sections. shard_size <= 0 means one shard.
+    Shards are halved further while a request is estimated above `budget` tokens
+    (estimate_request_tokens), down to one section per shard.
+    """
+    shard_size = GEMINI_SHARD_SECTIONS if shard_size is None else shard_size
+    budget = GEMINI_TOKEN_BUDGET if budget is None else budget
+    sections = list(constraints['sections'])
+    size = min(shard_size, len(sections)) if shard_size > 0 else len(sections)
+    if budget > 0:
+        while size > 1 and estimate_request_tokens(_shard(constraints, sections[:size]),
+                                                   fixed_slots, lab_blocks) > budget:
+            size = (size + 1) // 2
+    if size <= 0 or len(sections) <= size:
+        return [constraints]
+    return [_shard(constraints, sections[i:i + size]) for i in range(0, len(sections), size)]
+
+def _shard(constraints, sections):
+    own = set(sections)
+    return dict(constraints, sections=sections,
+                teacher_map={k: v for k, v in constraints['teacher_map'].items() if k[1] in own})
+
+async def _shard_entries(shard, fixed_slots, lab_blocks, refresh, on_entry, on_reject):
+    """
+    Stream one shard's entries into on_entry(entry) as soon as each is complete,
+    and entries that fail the shard's own checks into on_reject(Rejection).
+    Entries must fit the slot grid and the shard's own sections. Only a complete response is cached,
+    so a truncated one is asked again next time (its valid prefix is still used now).
+    """
+    key = _cache_key(shard, fixed_slots, lab_blocks)
+    cached = None if refresh else _cache_get(key)
+    if cached is not None:
+        for entry in cached:
+            on_entry(entry)
+        return
+
+    vocabulary = slot_vocabulary(fixed_slots, lab_blocks)
+    local = EntryValidator(sections=shard['sections'], subjects=shard['subjects'], teacher_map=shard['teacher_map'])
+    def accept(raw):
+        decoded = decode_entry(raw, vocabulary)
+        if decoded is None:
+            on_reject(Rejection(raw, 'not_a_slot', f"slot {raw.get('slot')!r}"))
+            return
+        entry = local.add(decoded)
+        if entry is not None:
+            on_entry(entry)
+        else:
+            on_reject(local.rejected[-1])
+
+    parser = JsonArrayParser()
+    prompt = build_prompt_from_constraints(shard, fixed_slots=fixed_slots, lab_blocks=lab_blocks)
+    async for text in stream_gemini(prompt):
+        for raw in parser.feed(text):
+            accept(raw)
+    if not parser.started:
+        # Not a JSON array after all (CSV, wrapper object): parse the whole text the old way
+        for raw in parse_gemini_output(parser.buffer) or []:
+            accept(raw)
+    if parser.closed or not parser.started:
+        _cache_set(key, local.accepted)
+
+def sharded_gemini_entries(constraints: dict, fixed_slots=None, lab_blocks=None, refresh=False,
+                           shard_size=None, concurrency=None, validator=None, progress=None):
+    """
+    Gemini entries for a course, one streamed request per group of sections:
+    - Shards (shard_constraints, within GEMINI_TOKEN_BUDGET) are requested concurrently,
+      at most `concurrency` at a time
+    - Each shard is cached on its own, so a change in one section re-asks only its shard
+    - Every entry goes through the shared `validator` (EntryValidator) the moment it arrives,
+      which reserves teachers across shards; pass one built on the course's occupancy
+    progress(done_shards, total_shards, accepted) is called as shards finish and every
+    STREAM_PROGRESS_EVERY accepted entries, in order on a separate thread (it may block,
+    e.g. on a database write, without stalling the other shards' streams).
+    Returns the accepted entries; validator.report() also lists every rejected one, from whichever shard.
+    """
+    shards = shard_constraints(constraints, shard_size, fixed_slots=fixed_slots, lab_blocks=lab_blocks)
+    validator = validator if validator is not None else EntryValidator()
+    reporter = ThreadPoolExecutor(max_workers=1, thread_name_prefix='gemini-progress') if progress else None
+    done = 0
+
+    def report():
+        if reporter:
+            reporter.submit(progress, done, len(shards), len(validator.accepted))
+
+    def on_entry(entry):
+        # Shards run on one event loop thread, so the validator needs no lock
+        if validator.add(entry) is not None and len(validator.accepted) % STREAM_PROGRESS_EVERY == 0:
+            report()
+
+    async def run_shard(shard, limit):
+        nonlocal done
+        async with limit:
+            try:
+                await _shard_entries(shard, fixed_slots, lab_blocks, refresh, on_entry, validator.rejected.append)
+            except Exception as e:
+                print(f"[Gemini] Shard error: {e}")
+        done += 1
+        report()
+
+    async def run_all():
+        limit = asyncio.Semaphore(concurrency or GEMINI_CONCURRENCY)
+        await asyncio.gather(*(run_shard(shard, limit) for shard in shards))
+
+    try:
+        asyncio.run(run_all())
+    finally:
+        if reporter:
+            reporter.shutdown(wait=True)
+    return validator.accepted
+
 def parse_gemini_output(text: str):
     """
     Parse Gemini output to a list of dict entries.
@@ -73,89 +244,293 @@ def parse_gemini_output(text: str):
     unique_entries = [dict(t) for t in {tuple(sorted(e.items())) for e in parsed}]
     return unique_entries
 
-def validate_entries(entries: list):
+class JsonArrayParser:
+    """
+    Incremental parser for a streamed JSON array of objects:
+    - feed(text) returns the objects completed by this chunk
+    - Text before the first '[' (markdown fences, prose) is skipped
+    - Consumed text is dropped, only the object being received is buffered
+    `started`/`closed` tell whether the array was opened/closed; a missing ']' means truncated output.
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        self.pos = 0           # next character of buffer to scan
+        self.started = False
+        self.closed = False
+        self.depth = 0         # nesting depth inside the array
+        self.in_string = False
+        self.escape = False
+        self.obj_start = None  # buffer offset of the top-level object being received
+
+    def feed(self, text: str):
+        self.buffer += text
+        buf, i, found = self.buffer, self.pos, []
+        while i < len(buf) and not self.closed:
+            ch = buf[i]
+            if not self.started:
+                self.started = ch == '['
+            elif self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == '\\':
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch in '{[':
+                if self.depth == 0 and ch == '{':
+                    self.obj_start = i
+                self.depth += 1
+            elif ch in '}]':
+                if self.depth == 0:
+                    self.closed = ch == ']'
+                else:
+                    self.depth -= 1
+                    if self.depth == 0 and self.obj_start is not None:
+                        try:
+                            obj = json.loads(buf[self.obj_start:i + 1])
+                        except ValueError:
+                            obj = None
+                        if isinstance(obj, dict):
+                            found.append(obj)
+                        self.obj_start = None
+            i += 1
+
+        if self.started:
+            keep = self.obj_start if self.obj_start is not None else i
+            self.buffer = buf[keep:]
+            if self.obj_start is not None:
+                self.obj_start -= keep
+            i -= keep
+        self.pos = i
+        return found
+
+
+class Rejection(NamedTuple):
+    entry: dict
+    reason: str    # see EntryValidator
+    detail: str
+
+
+class ValidationReport(NamedTuple):
+    accepted: list
+    rejected: list  # Rejection
+
+    def reasons(self):
+        """Rejected entry count per reason."""
+        return dict(Counter(r.reason for r in self.rejected))
+
+    def summary(self):
+        return ', '.join(f"{n} {reason}" for reason, n in sorted(self.reasons().items())) or 'none rejected'
+
+
+@lru_cache(maxsize=1024)
+def _parse_time(value):
+    # Gemini repeats the same few time strings thousands of times
+    return time_to_minutes(str(value))
+
+def _as_int(value):
+    if type(value) is int:
+        return value
+    if isinstance(value, bool) or value is None:
+        raise ValueError(value)
+    if isinstance(value, float) and not value.is_integer():
+        raise ValueError(value)
+    return int(value)
+
+
+class EntryValidator:
     """
-    Validate Gemini output entries for:
-    - No overlaps for teachers or sections
-    - Day and time correctness
+    Incremental validator for Gemini entries, one add() per entry. Rejection reasons:
+    - missing_field / bad_id / bad_day / bad_time: unusable values (ids and day are coerced to int)
+    - unknown_section / unknown_subject: not in `sections` / `subjects` rows (when given)
+    - teacher_not_assigned: teacher not listed for the subject and section in `teacher_map` (when given)
+    - lunch / not_a_slot: times that touch the lunch break or are not a lecture slot or lab block
+    - wrong_slot_kind: a lab in a lecture slot or a lecture in a lab block (when `subjects` is given)
+    - teacher_conflict / section_conflict: overlap with an accepted entry or teachers' other courses
+    - teacher_unavailable / weekly_limit: outside the teacher's availability or over their weekly hours
+    Conflicts are one AND per entry against minute bitmasks (see occupancy.Occupancy), accepted
+    entries are reserved immediately. `occupancy` is copied, not modified.
+    """
+
+    def __init__(self, occupancy=None, sections=None, subjects=None, teacher_map=None):
+        self.occupancy = occupancy.copy() if occupancy is not None else Occupancy()
+        self.sections = set(sections) if sections is not None else None
+        self.is_lab = {s['id']: bool(s['is_lab']) for s in subjects} if subjects is not None else None
+        self.teachers = {k: set(v) for k, v in teacher_map.items()} if teacher_map is not None else None
+        self.accepted = []
+        self.rejected = []
+
+    def add(self, e: dict):
+        """Return the entry with integer ids, `start_min` and `end_min` if it is valid, else None."""
+        reason, detail, entry = self._check(e)
+        if reason is not None:
+            self.rejected.append(Rejection(e, reason, detail))
+            return None
+        self.accepted.append(entry)
+        return entry
+
+    def _check(self, e):
+        if not isinstance(e, dict):
+            return 'missing_field', 'not an object', None
+        try:
+            raw = (e['teacher_id'], e['section_id'], e['day_of_week'], e['start_time'], e['end_time'],
+                   e['subject_id'])
+        except KeyError as err:
+            return 'missing_field', f"no {err}", None
+        if None in raw:
+            return 'missing_field', 'null value', None
+        try:
+            teacher_id, section_id, subject_id = _as_int(raw[0]), _as_int(raw[1]), _as_int(raw[5])
+        except (TypeError, ValueError):
+            return 'bad_id', f"teacher {raw[0]!r}, section {raw[1]!r}, subject {raw[5]!r}", None
+        try:
+            day = _as_int(raw[2])
+        except (TypeError, ValueError):
+            day = None
+        if day not in range(5):
+            return 'bad_day', repr(raw[2]), None
+        try:
+            start, end = _parse_time(raw[3]), _parse_time(raw[4])
+        except (TypeError, ValueError):
+            return 'bad_time', f"{raw[3]!r}-{raw[4]!r}", None
+        if end <= start:
+            return 'bad_time', f"{raw[3]}-{raw[4]}", None
+        if self.sections is not None and section_id not in self.sections:
+            return 'unknown_section', str(section_id), None
+        if self.is_lab is not None and subject_id not in self.is_lab:
+            return 'unknown_subject', str(subject_id), None
+        if self.teachers is not None and teacher_id not in self.teachers.get((subject_id, section_id), ()):
+            return 'teacher_not_assigned', f"teacher {teacher_id}, subject {subject_id}, section {section_id}", None
+
+        slot = GRID.find(start, end)
+        if slot is None:
+            if GRID.blocked_minutes(start, end):
+                return 'lunch', f"{raw[3]}-{raw[4]}", None
+            return 'not_a_slot', f"{raw[3]}-{raw[4]}", None
+        if self.is_lab is not None and slot.is_lab != self.is_lab[subject_id]:
+            return 'wrong_slot_kind', f"subject {subject_id} in {raw[3]}-{raw[4]}", None
+
+        occ, mask = self.occupancy, slot.mask
+        if occ.teacher.get((teacher_id, day), 0) & mask:
+            return 'teacher_conflict', f"teacher {teacher_id} day {day} {raw[3]}", None
+        if occ.section.get((section_id, day), 0) & mask:
+            return 'section_conflict', f"section {section_id} day {day} {raw[3]}", None
+        if occ.blocked.get((teacher_id, day), 0) & mask:
+            return 'teacher_unavailable', f"teacher {teacher_id} day {day} {raw[3]}", None
+        if end - start > occ.minutes_left(teacher_id):
+            return 'weekly_limit', f"teacher {teacher_id}", None
+        occ.reserve(day, mask, teacher_id=teacher_id, section_id=section_id)
+
+        entry = dict(e, teacher_id=teacher_id, section_id=section_id, subject_id=subject_id, day_of_week=day,
+                     start_min=start, end_min=end)
+        return None, None, entry
+
+    def report(self):
+        return ValidationReport(self.accepted, self.rejected)
+
+def validate_report(entries: list, occupancy=None, sections=None, subjects=None, teacher_map=None) -> ValidationReport:
+    """Validate entries in order; returns the accepted ones and a Rejection (with reason) for every other."""
+    validator = EntryValidator(occupancy, sections, subjects, teacher_map)
+    for e in entries or []:
+        validator.add(e)
+    return validator.report()
+
+def validate_entries(entries: list, occupancy=None):
+    """
+    Validate Gemini output entries (see EntryValidator; `occupancy` is not modified).
+    Times are parsed once into integer `start_min`/`end_min`, added to each returned entry.
     Returns only valid entries
     """
-    if not entries:
-        return []
+    return validate_report(entries, occupancy).accepted
 
-    # Track teacher/section schedule
-    teacher_schedule = {}
-    section_schedule = {}
-    valid_entries = []
+# Compact output keys Gemini is asked to use -> entry keys used everywhere else
+OUTPUT_KEYS = {'sec': 'section_id', 'sub': 'subject_id', 'tch': 'teacher_id', 'day': 'day_of_week'}
 
-    for e in entries:
+def slot_vocabulary(fixed_slots=None, lab_blocks=None):
+    """Slot ids of the prompt: lecture slots first, then lab blocks, as ('HH:MM', 'HH:MM') pairs."""
+    return [tuple(s) for s in (fixed_slots or [])] + [tuple(b) for b in (lab_blocks or [])]
+
+def encode_constraints(constraints: dict):
+    """
+    Compact, id-only form of the constraints for the prompt (no names, no whitespace):
+    sec = section ids, sub = lecture subject ids, lab = lab subject ids,
+    tch = subject id -> teacher ids, or section id -> teacher ids when they differ by section
+    """
+    subjects = constraints['subjects']
+    per_section = {}
+    for (subject_id, section_id), tids in constraints['teacher_map'].items():
+        per_section.setdefault(subject_id, {})[section_id] = list(tids)
+    teachers = {}
+    for subject_id, by_section in per_section.items():
+        lists = list(by_section.values())
+        same = all(tids == lists[0] for tids in lists)
+        teachers[str(subject_id)] = lists[0] if same else {str(s): t for s, t in by_section.items()}
+    encoded = {
+        'sec': list(constraints['sections']),
+        'sub': [s['id'] for s in subjects if not s['is_lab']],
+        'lab': [s['id'] for s in subjects if s['is_lab']],
+        'tch': teachers,
+    }
+    return json.dumps(encoded, separators=(',', ':'))
+
+def decode_entry(raw, vocabulary):
+    """
+    Gemini's compact entry -> the usual keys with start_time/end_time from the slot id.
+    Returns None if the slot id is not in `vocabulary`; entries that already carry times pass through.
+    """
+    if not isinstance(raw, dict):
+        return raw
+    e = {OUTPUT_KEYS.get(k, k): v for k, v in raw.items()}
+    if 'slot' in e and 'start_time' not in e:
         try:
-            teacher_id = e['teacher_id']
-            section_id = e['section_id']
-            day = e['day_of_week']
-            start = e['start_time']
-            end = e['end_time']
-
-            # Skip invalid or missing data
-            if None in (teacher_id, section_id, day, start, end):
-                continue
-
-            # Skip lunch period
-            if start < "12:30:00" < end or start < "13:30:00" < end:
-                continue
-
-            # Check teacher overlap
-            t_key = (teacher_id, day)
-            s_key = (section_id, day)
-            teacher_schedule.setdefault(t_key, [])
-            section_schedule.setdefault(s_key, [])
-
-            overlap = lambda st, en, intervals: any(not (en <= i[0] or st >= i[1]) for i in intervals)
-
-            if overlap(start, end, teacher_schedule[t_key]):
-                continue
-            if overlap(start, end, section_schedule[s_key]):
-                continue
-
-            # No overlaps → accept
-            teacher_schedule[t_key].append((start, end))
-            section_schedule[s_key].append((start, end))
-            valid_entries.append(e)
-        except Exception:
-            continue
+            slot = _as_int(e.pop('slot'))
+        except (TypeError, ValueError):
+            return None
+        if not 0 <= slot < len(vocabulary):
+            return None
+        e['start_time'], e['end_time'] = vocabulary[slot]
+    return e
+
+def estimate_tokens(text: str) -> int:
+    """Rough Gemini token count: about four characters per token for this JSON-heavy text."""
+    return (len(text) + 3) // 4
 
-    return valid_entries
+def estimate_request_tokens(constraints: dict, fixed_slots=None, lab_blocks=None) -> int:
+    """Prompt plus expected completion (one entry per section and subject) for one request."""
+    prompt = build_prompt_from_constraints(constraints, fixed_slots=fixed_slots, lab_blocks=lab_blocks)
+    entries = len(constraints['sections']) * len(constraints['subjects'])
+    return estimate_tokens(prompt) + entries * ENTRY_TOKENS
 
-def build_prompt_from_constraints(constraints: dict, fixed_slots=None):
+def build_prompt_from_constraints(constraints: dict, fixed_slots=None, lab_blocks=None):
     """
-    Build detailed prompt for Gemini:
-    - Fixed lecture slots (50 min)
-    - Labs 100 min fully before or after lunch
-    - No overlaps
-    - Lunch break 12:30–13:30 respected
-    - Output JSON array only
+    Build a compact prompt for Gemini:
+    - Lecture slots and lab blocks are numbered once, entries refer to them by id
+    - Constraints by id only (encode_constraints), output with short keys (OUTPUT_KEYS)
+    - No overlaps, lunch break respected, output JSON array only
     """
-    fixed_slots = fixed_slots or []
+    vocabulary = slot_vocabulary(fixed_slots, lab_blocks)
+    n_lectures = len(fixed_slots or [])
+    lectures = ' '.join(f"{i}={s}-{e}" for i, (s, e) in enumerate(vocabulary[:n_lectures]))
+    labs = ' '.join(f"{i}={s}-{e}" for i, (s, e) in enumerate(vocabulary[n_lectures:], n_lectures))
 
     prompt_lines = [
         "You are an assistant that creates college timetables.",
-        "OUTPUT FORMAT: JSON array of entries with keys:",
-        "section_id, subject_id, teacher_id, day_of_week (0=Mon), start_time, end_time.",
+        f"LECTURE SLOTS (id=start-end): {lectures}",
+        f"LAB SLOTS (id=start-end, consecutive periods): {labs}",
+        "INPUT: sec=section ids, sub=lecture subject ids, lab=lab subject ids, tch=subject id -> its teacher ids (or section id -> teacher ids)",
+        encode_constraints(constraints),
+        "TASK: give every section one session of every subject, Monday to Friday.",
         "RULES:",
-        "- Lectures must strictly follow these 50-minute slots (no splitting, no overlaps):",
-        json.dumps(fixed_slots, indent=2),
-        "- Labs must last exactly 100 minutes and must fully fit either before lunch (before 12:30) or after lunch (after 13:30). Do NOT split labs across lunch.",
+        "- Lectures use exactly one lecture slot id, labs exactly one lab slot id. Never split a session.",
+        "- The teacher must be one of the subject's teachers in tch (for that section, when tch lists sections).",
         "- No teacher or section can have overlapping sessions.",
-        "- Schedule only between 09:10–17:00 Monday to Friday.",
-        "- Lunch break 12:30–13:30 must be free for everyone.",
+        f"- Lunch break {LUNCH_BREAK[0]}-{LUNCH_BREAK[1]} must be free for everyone (no slot above touches it).",
         "- Balance the workload through the week as evenly as possible.",
-        "Input constraints:",
-        json.dumps(constraints, indent=2),
-        "Return ONLY valid JSON array (no markdown, no explanation).",
-        "IMPORTANT:",
-        "- Labs cannot start before lunch and end after lunch.",
-        "- Use only the fixed lecture slots above for lectures.",
-        "- Labs can start at any valid time outside lunch but must fully fit 100 minutes."
+        'OUTPUT: JSON array of {"sec":section id,"sub":subject id,"tch":teacher id,"day":0-4 (0=Mon),"slot":slot id}',
+        "Return ONLY the JSON array (no markdown, no explanation, no whitespace)."
     ]
 
     return "\n".join(prompt_lines)
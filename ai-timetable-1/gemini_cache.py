@@ -0,0 +1,94 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from config import GEMINI_CACHE_PATH, GEMINI_CACHE_MAX_BYTES
+
+
+class ResponseCache:
+    """
+    Persistent cache of Gemini results in a local SQLite file:
+    - Key: fingerprint() of the normalized constraints and prompt version
+    - Value: the parsed, grid-validated entries as JSON (not the raw completion)
+    - Least recently used rows are evicted once the stored JSON exceeds `max_bytes`
+    Shared by every worker on the host; max_bytes=0 disables it.
+    """
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            self._conn.execute('''CREATE TABLE IF NOT EXISTS gemini_responses (
+                key TEXT PRIMARY KEY,
+                entries TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                used_at REAL NOT NULL)''')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_gemini_used ON gemini_responses (used_at)')
+        return self._conn
+
+    def get(self, key):
+        if self.max_bytes <= 0:
+            return None
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute('SELECT entries FROM gemini_responses WHERE key=?', (key,)).fetchone()
+            if row is None:
+                return None
+            with conn:
+                conn.execute('UPDATE gemini_responses SET used_at=? WHERE key=?', (time.time(), key))
+            return json.loads(row[0])
+
+    def set(self, key, entries):
+        if self.max_bytes <= 0:
+            return
+        payload = json.dumps(entries, separators=(',', ':'), default=str)
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute('INSERT OR REPLACE INTO gemini_responses VALUES (?,?,?,?,?)',
+                             (key, payload, len(payload), now, now))
+                self._evict(conn)
+
+    def _evict(self, conn):
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM gemini_responses').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        doomed = []
+        for key, size in conn.execute('SELECT key, size FROM gemini_responses ORDER BY used_at'):
+            if total <= self.max_bytes:
+                break
+            doomed.append((key,))
+            total -= size
+        conn.executemany('DELETE FROM gemini_responses WHERE key=?', doomed)
+
+    def clear(self):
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute('DELETE FROM gemini_responses')
+
+
+response_cache = ResponseCache(GEMINI_CACHE_PATH, GEMINI_CACHE_MAX_BYTES)
+
+def fingerprint(constraints: dict, prompt_version, model_name='', extra=None) -> str:
+    """
+    SHA-256 over the inputs that decide a Gemini answer, independent of row and key order:
+    - sections, subjects (id, name, is_lab, duration) and teacher map, sorted
+    - prompt template version, model name and anything else in `extra` (e.g. the slot grid)
+    """
+    subjects = sorted(
+        [s['id'], s.get('name'), bool(s.get('is_lab')), s.get('default_duration_minutes')]
+        for s in constraints.get('subjects', [])
+    )
+    teacher_map = sorted([str(k), sorted(v)] for k, v in constraints.get('teacher_map', {}).items())
+    payload = json.dumps([prompt_version, model_name, sorted(constraints.get('sections', [])),
+                          subjects, teacher_map, extra], separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
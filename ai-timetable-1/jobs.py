@@ -0,0 +1,158 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from config import JOB_WORKERS, JOB_STALE_SECONDS
+from db import db_cursor, named_lock
+from solver import SolverError
+from timetable import generate_timetable_for_course, generate_all
+
+log = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='timetable-job')
+_submit_lock = threading.Lock()
+
+# Jobs queued or running in this process; the heartbeat keeps their updated_at fresh
+_active = set()
+_active_lock = threading.Lock()
+_heartbeat_thread = None
+HEARTBEAT_SECONDS = max(JOB_STALE_SECONDS // 4, 1)
+
+def submit_job(kind: str, course_id=None, engine: str = 'gemini', optimize: bool = False,
+               refresh: bool = False) -> int:
+    """
+    Queue a generation run on the local worker pool:
+    - kind='course' regenerates one course, kind='all' runs generate_all()
+    - Status, phase and progress are persisted in generation_jobs
+    - Single-flight: an identical request (same course, engine and constraint
+      fingerprint) attaches to the queued/running job instead of starting another
+    - refresh=True bypasses the cached Gemini result for the course
+    - Jobs of a dead worker (no heartbeat for JOB_STALE_SECONDS) are marked failed first
+    Returns the job id.
+    """
+    with db_cursor() as cur:
+        fingerprint = constraint_fingerprint(cur, kind, course_id, engine, optimize, refresh)
+    # The lookup and insert must be atomic across web workers, not only across this process's threads
+    with _submit_lock, named_lock(f"timetable_job_{fingerprint}"), db_cursor(commit=True) as cur:
+        reap_stale_jobs(cur)
+        cur.execute(
+            'SELECT id FROM generation_jobs '
+            "WHERE fingerprint=%s AND status IN ('queued','running') "
+            'AND updated_at > NOW() - INTERVAL %s SECOND '
+            'ORDER BY id DESC LIMIT 1',
+            (fingerprint, JOB_STALE_SECONDS)
+        )
+        inflight = cur.fetchone()
+        if inflight:
+            return inflight['id']
+
+        cur.execute(
+            'INSERT INTO generation_jobs (kind, course_id, engine, fingerprint, status, phase) '
+            'VALUES (%s,%s,%s,%s,%s,%s)',
+            (kind, course_id, engine, fingerprint, 'queued', 'queued')
+        )
+        job_id = cur.lastrowid
+    _track(job_id)
+    _executor.submit(_run_job, job_id, kind, course_id, engine, optimize, refresh)
+    return job_id
+
+def reap_stale_jobs(cur):
+    """Fail queued/running jobs whose worker stopped sending heartbeats (e.g. it was restarted)."""
+    cur.execute(
+        "UPDATE generation_jobs SET status='failed', phase='failed', message=%s "
+        "WHERE status IN ('queued','running') AND updated_at < NOW() - INTERVAL %s SECOND",
+        (f"Abandoned: no progress for {JOB_STALE_SECONDS} seconds (worker restarted?)", JOB_STALE_SECONDS)
+    )
+    return cur.rowcount
+
+def _track(job_id):
+    global _heartbeat_thread
+    with _active_lock:
+        _active.add(job_id)
+        if _heartbeat_thread is None or not _heartbeat_thread.is_alive():
+            _heartbeat_thread = threading.Thread(target=_heartbeat, name='timetable-job-heartbeat', daemon=True)
+            _heartbeat_thread.start()
+
+def _untrack(job_id):
+    with _active_lock:
+        _active.discard(job_id)
+
+def _heartbeat():
+    """
+    Every HEARTBEAT_SECONDS, while this process has jobs:
+    - Touch them, so long phases are not taken for dead ones
+    - Reap other workers' abandoned jobs, so their status pages stop polling
+    """
+    while True:
+        time.sleep(HEARTBEAT_SECONDS)
+        with _active_lock:
+            ids = sorted(_active)
+        if not ids:
+            continue
+        try:
+            with db_cursor(commit=True) as cur:
+                cur.execute(
+                    'UPDATE generation_jobs SET updated_at=NOW() '
+                    f"WHERE status IN ('queued','running') AND id IN ({','.join(['%s'] * len(ids))})",
+                    tuple(ids)
+                )
+                reap_stale_jobs(cur)
+        except Exception as e:
+            log.warning("Job heartbeat failed: %s", e)
+
+def constraint_fingerprint(cur, kind, course_id, engine, optimize, refresh=False) -> str:
+    """SHA-1 over the request and the course data a generation depends on."""
+    where, params = ('WHERE sec.course_id=%s', (course_id,)) if kind == 'course' else ('', ())
+    cur.execute(
+        'SELECT sec.id AS section_id, s.id AS subject_id, s.is_lab, s.default_duration_minutes, '
+        'ts.teacher_id, ts.section_id AS assigned_section '
+        'FROM sections sec '
+        'JOIN subjects s ON s.course_id=sec.course_id '
+        'LEFT JOIN teacher_subjects ts ON ts.subject_id=s.id ' + where + ' '
+        'ORDER BY sec.id, s.id, ts.teacher_id, ts.section_id',
+        params
+    )
+    rows = [list(r.values()) for r in cur.fetchall()]
+    payload = json.dumps([kind, course_id, engine, bool(optimize), bool(refresh), rows], default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+def get_job(job_id: int):
+    with db_cursor() as cur:
+        cur.execute('SELECT * FROM generation_jobs WHERE id=%s', (job_id,))
+        return cur.fetchone()
+
+def update_job(job_id: int, **fields):
+    columns = ', '.join(f'{k}=%s' for k in fields)
+    with db_cursor(commit=True) as cur:
+        cur.execute(f'UPDATE generation_jobs SET {columns} WHERE id=%s', (*fields.values(), job_id))
+
+def _run_job(job_id, kind, course_id, engine, optimize, refresh=False):
+    def progress(phase, placed=None):
+        fields = {'status': 'running', 'phase': phase}
+        if placed is not None:
+            fields['placed'] = placed
+        update_job(job_id, **fields)
+
+    try:
+        progress('starting')
+        if kind == 'all':
+            summary = generate_all(mode=engine, optimize=optimize, progress=progress)
+            done = {c: n for c, n in summary.items() if not isinstance(n, str)}
+            failed = [f"course {c}: {msg}" for c, msg in summary.items() if isinstance(msg, str)]
+            placed = sum(done.values())
+            message = f"Generated {len(done)} course timetables ({placed} entries)."
+            if failed:
+                message += " Skipped " + "; ".join(failed)
+        else:
+            placed = generate_timetable_for_course(course_id, mode=engine, optimize=optimize, progress=progress,
+                                                   refresh=refresh)
+            message = f"Timetable generated successfully with ({placed} entries)."
+        update_job(job_id, status='done', phase='done', placed=placed, message=message)
+    except SolverError as e:
+        update_job(job_id, status='failed', phase='failed', message=f"{e}: {'; '.join(e.reasons)}")
+    except Exception as e:
+        update_job(job_id, status='failed', phase='failed', message=str(e))
+    finally:
+        _untrack(job_id)
@@ -0,0 +1,290 @@
+from db import db_cursor, named_lock
+
+# Schema as first shipped; CREATE ... IF NOT EXISTS so existing databases adopt it as version 1
+BASELINE_SQL = [
+    """CREATE TABLE IF NOT EXISTS teachers (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        name VARCHAR(255) NOT NULL,
+        email VARCHAR(255) UNIQUE,
+        password VARCHAR(255) DEFAULT '',
+        max_hours_per_week INT DEFAULT 20
+    ) ENGINE=InnoDB;""",
+    """CREATE TABLE IF NOT EXISTS hods (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        name VARCHAR(255) NOT NULL,
+        email VARCHAR(255) UNIQUE,
+        password VARCHAR(255) NOT NULL
+    ) ENGINE=InnoDB;""",
+    """CREATE TABLE IF NOT EXISTS courses (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        name VARCHAR(255) NOT NULL,
+        degree VARCHAR(100)
+    ) ENGINE=InnoDB;""",
+    """CREATE TABLE IF NOT EXISTS sections (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        course_id INT NOT NULL,
+        name VARCHAR(50),
+        FOREIGN KEY (course_id) REFERENCES courses(id) ON DELETE CASCADE
+    ) ENGINE=InnoDB;""",
+    """CREATE TABLE IF NOT EXISTS subjects (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        name VARCHAR(255) NOT NULL,
+        course_id INT,
+        is_lab BOOLEAN DEFAULT FALSE,
+        default_duration_minutes INT DEFAULT 60,
+        FOREIGN KEY (course_id) REFERENCES courses(id) ON DELETE SET NULL
+    ) ENGINE=InnoDB;""",
+    """CREATE TABLE IF NOT EXISTS teacher_subjects (
+        teacher_id INT,
+        subject_id INT,
+        PRIMARY KEY (teacher_id, subject_id),
+        FOREIGN KEY (teacher_id) REFERENCES teachers(id) ON DELETE CASCADE,
+        FOREIGN KEY (subject_id) REFERENCES subjects(id) ON DELETE CASCADE
+    ) ENGINE=InnoDB;""",
+    """CREATE TABLE IF NOT EXISTS teacher_availability (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        teacher_id INT,
+        day_of_week INT,
+        start_time TIME,
+        end_time TIME,
+        FOREIGN KEY (teacher_id) REFERENCES teachers(id) ON DELETE CASCADE
+    ) ENGINE=InnoDB;""",
+    """CREATE TABLE IF NOT EXISTS timetable_entries (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        section_id INT,
+        subject_id INT,
+        teacher_id INT,
+        day_of_week INT,
+        start_time TIME,
+        end_time TIME,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (section_id) REFERENCES sections(id) ON DELETE CASCADE,
+        FOREIGN KEY (subject_id) REFERENCES subjects(id) ON DELETE SET NULL,
+        FOREIGN KEY (teacher_id) REFERENCES teachers(id) ON DELETE SET NULL
+    ) ENGINE=InnoDB;"""
+]
+
+
+def _column_exists(cur, table, column):
+    cur.execute('SELECT COUNT(*) AS n FROM information_schema.columns '
+                'WHERE table_schema=DATABASE() AND table_name=%s AND column_name=%s', (table, column))
+    return cur.fetchone()['n'] > 0
+
+def _index_exists(cur, table, index):
+    cur.execute('SELECT COUNT(*) AS n FROM information_schema.statistics '
+                'WHERE table_schema=DATABASE() AND table_name=%s AND index_name=%s', (table, index))
+    return cur.fetchone()['n'] > 0
+
+def _is_generated(cur, table, column):
+    cur.execute('SELECT extra FROM information_schema.columns '
+                'WHERE table_schema=DATABASE() AND table_name=%s AND column_name=%s', (table, column))
+    row = cur.fetchone()
+    return bool(row) and 'GENERATED' in (row['extra'] or '').upper()
+
+def _is_stored(cur, table, column):
+    """The column exists and is a plain (not generated) column."""
+    return _column_exists(cur, table, column) and not _is_generated(cur, table, column)
+
+def _drop_index(table, index):
+    def step(cur):
+        if _index_exists(cur, table, index):
+            cur.execute(f'DROP INDEX {index} ON {table}')
+    return step
+
+def _add_index(table, index, columns):
+    def step(cur):
+        if not _index_exists(cur, table, index):
+            cur.execute(f'CREATE INDEX {index} ON {table} ({columns})')
+    return step
+
+def _baseline(cur):
+    for sql in BASELINE_SQL:
+        cur.execute(sql)
+
+def _teacher_subject_sections(cur):
+    """
+    Assignments are per section (NULL = every section of the course):
+    - add teacher_subjects.section_id if an older install lacks it
+    - replace the (teacher_id, subject_id) primary key, which allowed only one section
+    """
+    if not _column_exists(cur, 'teacher_subjects', 'section_id'):
+        cur.execute('ALTER TABLE teacher_subjects ADD COLUMN section_id INT NULL, '
+                    'ADD FOREIGN KEY (section_id) REFERENCES sections(id) ON DELETE CASCADE')
+    if not _index_exists(cur, 'teacher_subjects', 'uq_teacher_subject_section'):
+        cur.execute('ALTER TABLE teacher_subjects '
+                    'ADD UNIQUE KEY uq_teacher_subject_section (teacher_id, subject_id, section_id)')
+    if _index_exists(cur, 'teacher_subjects', 'PRIMARY'):
+        cur.execute('ALTER TABLE teacher_subjects DROP PRIMARY KEY')
+
+def _timetable_versions(cur):
+    """
+    Immutable timetable versions with a per-course published pointer:
+    - existing entries become one 'migrated' version per course, published
+    - the teacher index gains version_id so historical versions are skipped in the index
+    """
+    cur.execute("""CREATE TABLE IF NOT EXISTS timetable_versions (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        course_id INT NOT NULL,
+        source VARCHAR(50),
+        entry_count INT DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        INDEX idx_versions_course (course_id, id),
+        FOREIGN KEY (course_id) REFERENCES courses(id) ON DELETE CASCADE
+    ) ENGINE=InnoDB;""")
+    if not _column_exists(cur, 'courses', 'published_version_id'):
+        # No FK back to timetable_versions: the pruner never deletes a published version
+        cur.execute('ALTER TABLE courses ADD COLUMN published_version_id INT NULL')
+    if not _column_exists(cur, 'timetable_entries', 'version_id'):
+        cur.execute('ALTER TABLE timetable_entries ADD COLUMN version_id INT NULL, '
+                    'ADD FOREIGN KEY (version_id) REFERENCES timetable_versions(id) ON DELETE CASCADE')
+    _add_index('timetable_entries', 'idx_entries_version_section',
+               'version_id, section_id, day_of_week, start_time')(cur)
+    if _index_exists(cur, 'timetable_entries', 'idx_entries_teacher_day_start'):
+        cur.execute('DROP INDEX idx_entries_teacher_day_start ON timetable_entries')
+    _add_index('timetable_entries', 'idx_entries_teacher_version',
+               'teacher_id, version_id, day_of_week, start_time, end_time, section_id')(cur)
+
+    cur.execute("INSERT INTO timetable_versions (course_id, source, entry_count) "
+                "SELECT sec.course_id, 'migrated', COUNT(*) FROM timetable_entries t "
+                "JOIN sections sec ON t.section_id=sec.id "
+                "WHERE t.version_id IS NULL GROUP BY sec.course_id")
+    cur.execute("UPDATE timetable_entries t JOIN sections sec ON t.section_id=sec.id "
+                "JOIN timetable_versions v ON v.course_id=sec.course_id AND v.source='migrated' "
+                "SET t.version_id=v.id WHERE t.version_id IS NULL")
+    cur.execute("UPDATE courses c JOIN timetable_versions v ON v.course_id=c.id AND v.source='migrated' "
+                "SET c.published_version_id=v.id WHERE c.published_version_id IS NULL")
+    # Entries of deleted sections/courses cannot belong to any version
+    cur.execute('DELETE FROM timetable_entries WHERE version_id IS NULL')
+
+def _minute_columns(cur):
+    """
+    Integer minutes of the day become the stored time representation:
+    - timetable_entries.start_min/end_min are written by the app; start_time/end_time turn into
+      virtual columns derived from them (kept for ad-hoc SQL and reports)
+    - teacher_availability is still entered as TIME, so its minute columns are generated from it
+    MySQL DDL is not transactional: every ADD/DROP is checked first, one column at a time,
+    so a run that failed halfway can simply be re-run.
+    """
+    for time_col, min_col in (('start_time', 'start_min'), ('end_time', 'end_min')):
+        if not _column_exists(cur, 'timetable_entries', min_col):
+            cur.execute(f'ALTER TABLE timetable_entries ADD COLUMN {min_col} SMALLINT NULL')
+        # Backfill only while the TIME column still holds the data (a stored column)
+        if _is_stored(cur, 'timetable_entries', time_col):
+            cur.execute(f'UPDATE timetable_entries SET {min_col}=TIME_TO_SEC({time_col}) DIV 60 '
+                        f'WHERE {min_col} IS NULL')
+
+    for index in ('idx_entries_section_day_start', 'idx_entries_version_section', 'idx_entries_teacher_version'):
+        _drop_index('timetable_entries', index)(cur)
+    for time_col, min_col in (('start_time', 'start_min'), ('end_time', 'end_min')):
+        if _is_stored(cur, 'timetable_entries', time_col):
+            cur.execute(f'ALTER TABLE timetable_entries DROP COLUMN {time_col}')
+        if not _column_exists(cur, 'timetable_entries', time_col):
+            cur.execute(f'ALTER TABLE timetable_entries '
+                        f'ADD COLUMN {time_col} TIME AS (SEC_TO_TIME({min_col} * 60)) VIRTUAL')
+    _add_index('timetable_entries', 'idx_entries_section_day_min',
+               'section_id, day_of_week, start_min, end_min')(cur)
+    _add_index('timetable_entries', 'idx_entries_version_section_min',
+               'version_id, section_id, day_of_week, start_min')(cur)
+    _add_index('timetable_entries', 'idx_entries_teacher_version_min',
+               'teacher_id, version_id, day_of_week, start_min, end_min, section_id')(cur)
+
+    for time_col, min_col in (('start_time', 'start_min'), ('end_time', 'end_min')):
+        if not _column_exists(cur, 'teacher_availability', min_col):
+            cur.execute(f'ALTER TABLE teacher_availability '
+                        f'ADD COLUMN {min_col} SMALLINT AS (TIME_TO_SEC({time_col}) DIV 60) STORED')
+
+def _jobs_fingerprint_index(cur):
+    """Single-flight lookup in jobs.submit_job; the column only exists once generation_jobs is migrated (6)."""
+    if _column_exists(cur, 'generation_jobs', 'fingerprint'):
+        _add_index('generation_jobs', 'idx_jobs_fingerprint_status', 'fingerprint, status')(cur)
+
+def _generation_jobs(cur):
+    """
+    Background generation jobs (jobs.py):
+    - create the table where it does not exist yet
+    - installs that created it before migrations may lack the progress and single-flight columns
+    """
+    cur.execute("""CREATE TABLE IF NOT EXISTS generation_jobs (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        kind VARCHAR(20) NOT NULL,
+        course_id INT,
+        engine VARCHAR(20),
+        status VARCHAR(20) NOT NULL DEFAULT 'queued',
+        message TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (course_id) REFERENCES courses(id) ON DELETE CASCADE
+    ) ENGINE=InnoDB;""")
+    for column, definition in (
+        ('fingerprint', 'CHAR(40)'),
+        ('phase', "VARCHAR(100) DEFAULT ''"),
+        ('placed', 'INT DEFAULT 0'),
+        ('updated_at', 'TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP'),
+    ):
+        if not _column_exists(cur, 'generation_jobs', column):
+            cur.execute(f'ALTER TABLE generation_jobs ADD COLUMN {column} {definition}')
+    _jobs_fingerprint_index(cur)
+
+# (version, description, steps); steps are SQL strings or callables taking a cursor.
+# Append only: never edit or reorder a migration that has shipped.
+MIGRATIONS = [
+    (1, 'baseline schema', [_baseline]),
+    (2, 'per-section teacher assignments', [_teacher_subject_sections]),
+    (3, 'timetable access-path indexes', [
+        # Section views and exports: WHERE section_id ... ORDER BY day_of_week, start_time
+        _add_index('timetable_entries', 'idx_entries_section_day_start',
+                   'section_id, day_of_week, start_time, end_time'),
+        # Teacher views and conflict checks; covers load_teacher_occupancy including its sections join
+        _add_index('timetable_entries', 'idx_entries_teacher_day_start',
+                   'teacher_id, day_of_week, start_time, end_time, section_id'),
+        _add_index('teacher_availability', 'idx_availability_teacher_day',
+                   'teacher_id, day_of_week, start_time, end_time'),
+        _jobs_fingerprint_index,
+    ]),
+    (4, 'versioned timetables', [_timetable_versions]),
+    (5, 'integer minute columns', [_minute_columns]),
+    (6, 'generation jobs table', [_generation_jobs]),
+]
+
+def _ensure_version_table(cur):
+    cur.execute("""CREATE TABLE IF NOT EXISTS schema_version (
+        version INT PRIMARY KEY,
+        description VARCHAR(255),
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    ) ENGINE=InnoDB;""")
+
+def _current_version(cur):
+    cur.execute('SELECT MAX(version) AS v FROM schema_version')
+    row = cur.fetchone()
+    return (row and row['v']) or 0
+
+def migrate(target=None):
+    """
+    Apply pending migrations in order, up to `target` (default: latest):
+    - One MySQL named lock, so concurrent app starts do not race
+    - Each migration is recorded in schema_version right after it runs
+    - Steps are idempotent, a half-applied migration can simply be re-run
+    Returns the list of versions applied.
+    """
+    target = MIGRATIONS[-1][0] if target is None else target
+    applied = []
+    with named_lock('schema_migrations'):
+        with db_cursor(commit=True) as cur:
+            _ensure_version_table(cur)
+            current = _current_version(cur)
+        for version, description, steps in MIGRATIONS:
+            if version <= current or version > target:
+                continue
+            # MySQL commits DDL implicitly, so every migration gets its own transaction for the bookkeeping
+            with db_cursor(commit=True) as cur:
+                for step in steps:
+                    if callable(step):
+                        step(cur)
+                    else:
+                        cur.execute(step)
+                cur.execute('INSERT INTO schema_version (version, description) VALUES (%s, %s)',
+                            (version, description))
+            applied.append(version)
+    return applied
+
+if __name__ == '__main__':
+    print(f"Applied migrations: {migrate() or 'none'}")
@@ -0,0 +1,137 @@
+from versions import PUBLISHED_ENTRIES
+
+def interval_mask(start_min: int, end_min: int) -> int:
+    """Bitmask with one bit per minute of the day in [start_min, end_min)."""
+    if end_min <= start_min:
+        return 0
+    return ((1 << (end_min - start_min)) - 1) << start_min
+
+FULL_DAY = interval_mask(0, 24 * 60)
+
+
+class Occupancy:
+    """
+    Busy-time index for the generators:
+    - One integer bitmask per (teacher, day) and per (section, day)
+    - Bit n set = minute n of the day is taken
+    - Conflict check is a single AND against a precomputed slot mask
+    - Optional per-teacher availability (blocked minutes) and weekly minute limits
+    """
+
+    def __init__(self):
+        self.teacher = {}  # (teacher_id, day) -> mask
+        self.section = {}  # (section_id, day) -> mask
+        self.blocked = {}  # (teacher_id, day) -> minutes outside the teacher's availability
+        self.limit = {}    # teacher_id -> max minutes per week
+        self.used = {}     # teacher_id -> minutes reserved
+
+    def copy(self):
+        other = Occupancy()
+        other.teacher = dict(self.teacher)
+        other.section = dict(self.section)
+        other.blocked = self.blocked  # read-only after loading
+        other.limit = self.limit
+        other.used = dict(self.used)
+        return other
+
+    def minutes_left(self, teacher_id):
+        if teacher_id not in self.limit:
+            return float('inf')
+        return self.limit[teacher_id] - self.used.get(teacher_id, 0)
+
+    def busy(self, day, teacher_id=None, section_id=None) -> int:
+        mask = 0
+        if teacher_id is not None:
+            mask |= self.teacher.get((teacher_id, day), 0) | self.blocked.get((teacher_id, day), 0)
+        if section_id is not None:
+            mask |= self.section.get((section_id, day), 0)
+        return mask
+
+    def fits(self, day, mask, teacher_id=None, section_id=None) -> bool:
+        if self.busy(day, teacher_id, section_id) & mask:
+            return False
+        return teacher_id is None or mask.bit_count() <= self.minutes_left(teacher_id)
+
+    def free_slots(self, slots, day, teacher_id=None, section_id=None):
+        """Slots (see slots.Slot) that are free for the given teacher/section."""
+        busy = self.busy(day, teacher_id, section_id)
+        left = self.minutes_left(teacher_id) if teacher_id is not None else float('inf')
+        return [slot for slot in slots if not busy & slot.mask and slot.end_min - slot.start_min <= left]
+
+    def reserve(self, day, mask, teacher_id=None, section_id=None):
+        if teacher_id is not None:
+            key = (teacher_id, day)
+            current = self.teacher.get(key, 0)
+            self.used[teacher_id] = self.used.get(teacher_id, 0) + (mask & ~current).bit_count()
+            self.teacher[key] = current | mask
+        if section_id is not None:
+            key = (section_id, day)
+            self.section[key] = self.section.get(key, 0) | mask
+
+    def release(self, day, mask, teacher_id=None, section_id=None):
+        if teacher_id is not None:
+            key = (teacher_id, day)
+            current = self.teacher.get(key, 0)
+            self.used[teacher_id] = self.used.get(teacher_id, 0) - (current & mask).bit_count()
+            self.teacher[key] = current & ~mask
+        if section_id is not None:
+            key = (section_id, day)
+            self.section[key] = self.section.get(key, 0) & ~mask
+
+
+def load_teacher_availability(cur, teacher_ids, occupancy=None):
+    """
+    Teacher hard constraints in one query (teachers LEFT JOIN teacher_availability):
+    - Teachers with availability rows are blocked outside those windows, every day
+    - Teachers without rows are available all week
+    - max_hours_per_week becomes a weekly minute limit
+    """
+    occupancy = occupancy or Occupancy()
+    teacher_ids = sorted(set(teacher_ids))
+    if not teacher_ids:
+        return occupancy
+    placeholders = ','.join(['%s'] * len(teacher_ids))
+    cur.execute(
+        'SELECT t.id AS teacher_id, t.max_hours_per_week, a.day_of_week, a.start_min, a.end_min '
+        'FROM teachers t '
+        'LEFT JOIN teacher_availability a ON a.teacher_id=t.id '
+        f'WHERE t.id IN ({placeholders})',
+        tuple(teacher_ids)
+    )
+    windows = {}  # teacher_id -> {day: mask}
+    for r in cur.fetchall():
+        if r['max_hours_per_week'] is not None:
+            occupancy.limit[r['teacher_id']] = r['max_hours_per_week'] * 60
+        if r['day_of_week'] is None:
+            continue
+        days = windows.setdefault(r['teacher_id'], {})
+        days[r['day_of_week']] = days.get(r['day_of_week'], 0) | interval_mask(r['start_min'], r['end_min'])
+    for tid, days in windows.items():
+        for day in range(7):
+            occupancy.blocked[(tid, day)] = FULL_DAY & ~days.get(day, 0)
+    return occupancy
+
+def load_teacher_occupancy(cur, teacher_ids, exclude_course_id=None, occupancy=None, exclude_course_ids=()):
+    """
+    Global teacher index across courses:
+    - One query over the published timetable_entries of all given teachers
+    - Entries of `exclude_course_id`/`exclude_course_ids` (courses being regenerated) are skipped
+    Returns an Occupancy with only teacher masks set.
+    """
+    occupancy = occupancy or Occupancy()
+    teacher_ids = sorted(set(teacher_ids))
+    if not teacher_ids:
+        return occupancy
+    excluded = sorted(set(exclude_course_ids) | ({exclude_course_id} if exclude_course_id is not None else set()))
+    where = f"WHERE t.teacher_id IN ({','.join(['%s'] * len(teacher_ids))}) AND {PUBLISHED_ENTRIES}"
+    if excluded:
+        where += f" AND sec.course_id NOT IN ({','.join(['%s'] * len(excluded))})"
+    cur.execute(
+        'SELECT t.teacher_id, t.day_of_week, t.start_min, t.end_min '
+        'FROM timetable_entries t '
+        'JOIN sections sec ON t.section_id=sec.id ' + where,
+        (*teacher_ids, *excluded)
+    )
+    for r in cur.fetchall():
+        occupancy.reserve(r['day_of_week'], interval_mask(r['start_min'], r['end_min']), teacher_id=r['teacher_id'])
+    return occupancy
@@ -0,0 +1,133 @@
+import math
+import random
+import time
+from config import OPTIMIZER_BUDGET_SECONDS
+from occupancy import Occupancy
+from slots import GRID
+
+DAYS = range(5)  # Monday-Friday
+
+# Soft-constraint weights
+W_TEACHER_BALANCE = 1.0  # per hour^2 of deviation from the teacher's daily mean
+W_SECTION_GAP = 1.0      # per idle hour between a section's classes (lunch excluded)
+W_BACK_TO_BACK_LAB = 5.0  # per pair of consecutive labs in a section
+
+def _teacher_cost(loads):
+    """Variance-style cost of one teacher's per-day minutes."""
+    mean = sum(loads) / len(loads)
+    return W_TEACHER_BALANCE * sum(((m - mean) / 60) ** 2 for m in loads)
+
+def _section_day_cost(intervals):
+    """Idle gaps and back-to-back labs for one section on one day; intervals are (start, end, is_lab)."""
+    cost = 0.0
+    intervals = sorted(intervals)
+    for (s1, e1, lab1), (s2, e2, lab2) in zip(intervals, intervals[1:]):
+        gap = s2 - e1
+        if gap > 0:
+            gap -= GRID.blocked_minutes(e1, s2)
+            cost += W_SECTION_GAP * gap / 60
+        if lab1 and lab2 and s2 - e1 <= 0:
+            cost += W_BACK_TO_BACK_LAB
+    return cost
+
+def penalty(entries, subjects):
+    """Total soft-constraint penalty of entries from greedy_schedule()/solve_course()."""
+    is_lab = {s['id']: bool(s['is_lab']) for s in subjects}
+    loads, section_days = {}, {}
+    for section_id, subj_id, teacher_id, day, start_min, end_min in entries:
+        loads.setdefault(teacher_id, [0] * len(DAYS))[day] += end_min - start_min
+        section_days.setdefault((section_id, day), []).append((start_min, end_min, is_lab[subj_id]))
+    return (sum(_teacher_cost(l) for l in loads.values())
+            + sum(_section_day_cost(i) for i in section_days.values()))
+
+def improve(entries, subjects, teacher_map, budget_seconds=None, occupancy=None, rng=None):
+    """
+    Anytime simulated annealing over a feasible timetable:
+    - Move: relocate one entry to another free (day, slot, teacher of its section in `teacher_map`)
+    - Hard constraints stay satisfied, only soft penalties change
+    - Stops when the wall-clock budget expires
+    `occupancy` is busy time outside `entries` and is not modified.
+    Returns the best entries found.
+    """
+    budget = OPTIMIZER_BUDGET_SECONDS if budget_seconds is None else budget_seconds
+    rng = rng or random.Random()
+    entries = list(entries)
+    if not entries or budget <= 0:
+        return entries
+
+    subj_by_id = {s['id']: s for s in subjects}
+    occupancy = occupancy.copy() if occupancy else Occupancy()
+    loads, section_days = {}, {}
+    for i, (section_id, subj_id, teacher_id, day, start_min, end_min) in enumerate(entries):
+        occupancy.reserve(day, _mask(subj_by_id[subj_id], start_min),
+                          teacher_id=teacher_id, section_id=section_id)
+        loads.setdefault(teacher_id, [0] * len(DAYS))[day] += end_min - start_min
+        section_days.setdefault((section_id, day), set()).add(i)
+    for tids in teacher_map.values():
+        for tid in tids:
+            loads.setdefault(tid, [0] * len(DAYS))
+
+    def section_cost(key):
+        return _section_day_cost([(entries[i][4], entries[i][5], bool(subj_by_id[entries[i][1]]['is_lab']))
+                                  for i in section_days.get(key, ())])
+
+    current = best = penalty(entries, subjects)
+    best_entries = list(entries)
+    t_start, t_end = max(current / len(entries), 1.0), 0.01
+    started = time.monotonic()
+
+    while True:
+        elapsed = time.monotonic() - started
+        if elapsed >= budget:
+            break
+        temperature = t_start * (t_end / t_start) ** (elapsed / budget)
+
+        i = rng.randrange(len(entries))
+        section_id, subj_id, old_tid, old_day, old_start, old_end = entries[i]
+        subj = subj_by_id[subj_id]
+        new_tid = rng.choice(teacher_map[(subj_id, section_id)])
+        new_day = rng.choice(DAYS)
+        new_start, new_end, new_mask = rng.choice(GRID.for_subject(subj))[:3]
+        if (new_tid, new_day, new_start) == (old_tid, old_day, old_start):
+            continue
+
+        old_mask = _mask(subj, old_start)
+        occupancy.release(old_day, old_mask, teacher_id=old_tid, section_id=section_id)
+        if not occupancy.fits(new_day, new_mask, teacher_id=new_tid, section_id=section_id):
+            occupancy.reserve(old_day, old_mask, teacher_id=old_tid, section_id=section_id)
+            continue
+
+        teachers = {old_tid, new_tid}
+        keys = {(section_id, old_day), (section_id, new_day)}
+        before = sum(_teacher_cost(loads[t]) for t in teachers) + sum(section_cost(k) for k in keys)
+
+        entries[i] = (section_id, subj_id, new_tid, new_day, new_start, new_end)
+        loads[old_tid][old_day] -= old_end - old_start
+        loads[new_tid][new_day] += new_end - new_start
+        section_days[(section_id, old_day)].discard(i)
+        section_days.setdefault((section_id, new_day), set()).add(i)
+        after = sum(_teacher_cost(loads[t]) for t in teachers) + sum(section_cost(k) for k in keys)
+
+        delta = after - before
+        if delta <= 0 or rng.random() < math.exp(-delta / temperature):
+            occupancy.reserve(new_day, new_mask, teacher_id=new_tid, section_id=section_id)
+            current += delta
+            if current < best - 1e-9:
+                best = current
+                best_entries = list(entries)
+        else:
+            # Undo the move
+            entries[i] = (section_id, subj_id, old_tid, old_day, old_start, old_end)
+            loads[new_tid][new_day] -= new_end - new_start
+            loads[old_tid][old_day] += old_end - old_start
+            section_days[(section_id, new_day)].discard(i)
+            section_days[(section_id, old_day)].add(i)
+            occupancy.reserve(old_day, old_mask, teacher_id=old_tid, section_id=section_id)
+
+    return best_entries
+
+def _mask(subj, start_min):
+    slot = GRID.starting_at(start_min, subj['is_lab'])
+    if slot is None:
+        raise ValueError(f"No slot starts at minute {start_min}")
+    return slot.mask
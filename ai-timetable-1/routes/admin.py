@@ -1,9 +1,11 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session
-from db import db_cursor
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify
+from db import db_cursor, bulk_insert, pool_status, replica_status
 from functools import wraps
-from utils import safe_fmt_time
-from gemini import build_prompt_from_constraints, call_gemini, parse_gemini_output, validate_entries
-from utils import FIXED_SLOTS
+from timetable import repair_assignment, rollback_timetable, COURSE_ENGINES, GENERATE_ALL_ENGINES
+from constraints import invalidate_constraints
+from cache import invalidate_timetables
+from versions import course_timetable, list_versions
+from jobs import submit_job, get_job
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 # --- HOD access decorator ---
 def hod_required(f):
@@ -24,7 +26,7 @@ def admin():
 @admin_bp.route('/courses')
 @hod_required
 def courses():
-    with db_cursor() as cur:
+    with db_cursor(read_only=True) as cur:
         cur.execute('SELECT * FROM courses')
         courses = cur.fetchall()
     return render_template('courses.html', courses=courses)
@@ -64,6 +66,7 @@ def edit_course(course_id):
 
             # ✅ Ensure the transaction is committed
             cur._connection.commit()
+            invalidate_timetables()
 
             flash("Course updated successfully", "success")
             return redirect(url_for('admin.courses'))
@@ -85,6 +88,8 @@ def edit_course(course_id):
 def delete_course(course_id):
     with db_cursor(commit=True) as cur:
         cur.execute("DELETE FROM courses WHERE id = %s", (course_id,))
+    invalidate_constraints(course_id)
+    invalidate_timetables()
     flash("Course deleted successfully!", "success")
     return redirect(url_for('admin.courses'))
 
@@ -92,7 +97,7 @@ def delete_course(course_id):
 @admin_bp.route('/sections')
 @hod_required
 def sections():
-    with db_cursor() as cur:
+    with db_cursor(read_only=True) as cur:
         # Fetch all courses first
         cur.execute('SELECT * FROM courses')
         courses = cur.fetchall()
@@ -116,6 +121,7 @@ def add_section():
         return redirect(url_for('admin.sections'))
     with db_cursor(commit=True) as cur:
         cur.execute('INSERT INTO sections (name, course_id) VALUES (%s, %s)', (name, course_id))
+    invalidate_constraints(int(course_id))
     flash("Section added successfully","success")
     return redirect(url_for('admin.sections'))
 @admin_bp.route('/sections/edit/<int:section_id>', methods=['POST'])
@@ -129,6 +135,8 @@ def edit_section(section_id):
 
     with db_cursor(commit=True) as cur:
         cur.execute('UPDATE sections SET name = %s, course_id = %s WHERE id = %s', (name, course_id, section_id))
+    invalidate_constraints()  # the section may have moved between courses
+    invalidate_timetables()
 
     flash("Section updated successfully", "success")
     return redirect(url_for('admin.sections'))
@@ -139,6 +147,8 @@ def edit_section(section_id):
 def delete_section(section_id):
     with db_cursor(commit=True) as cur:
         cur.execute('DELETE FROM sections WHERE id = %s', (section_id,))
+    invalidate_constraints()
+    invalidate_timetables()
     flash("Section deleted successfully", "success")
     return redirect(url_for('admin.sections'))
 
@@ -147,7 +157,7 @@ def delete_section(section_id):
 @admin_bp.route('/subjects')
 @hod_required
 def subjects():
-    with db_cursor() as cur:
+    with db_cursor(read_only=True) as cur:
         # Fetch subjects with course names
         cur.execute('''
             SELECT s.id, s.name, s.is_lab, s.default_duration_minutes, s.course_id, c.name AS course_name
@@ -180,6 +190,7 @@ def add_subject():
             'INSERT INTO subjects (name, course_id, is_lab, default_duration_minutes) VALUES (%s,%s,%s,%s)',
             (name, course_id, is_lab, duration)
         )
+    invalidate_constraints(int(course_id))
     flash("Subject added successfully", "success")
     return redirect(url_for('admin.subjects'))
 
@@ -199,12 +210,14 @@ def edit_subject(subject_id):
                 'UPDATE subjects SET name=%s, course_id=%s, is_lab=%s, default_duration_minutes=%s WHERE id=%s',
                 (name, course_id, is_lab, duration, subject_id)
             )
+        invalidate_constraints()
+        invalidate_timetables()
 
         flash("Subject updated successfully", "success")
         return redirect(url_for('admin.subjects'))
 
     # GET: fetch subject and courses
-    with db_cursor() as cur:
+    with db_cursor(read_only=True) as cur:
         cur.execute('SELECT * FROM subjects WHERE id=%s', (subject_id,))
         subject = cur.fetchone()
         cur.execute('SELECT id, name FROM courses ORDER BY name')
@@ -218,6 +231,8 @@ def edit_subject(subject_id):
 def delete_subject(subject_id):
     with db_cursor(commit=True) as cur:
         cur.execute('DELETE FROM subjects WHERE id=%s', (subject_id,))
+    invalidate_constraints()
+    invalidate_timetables()
     flash("Subject deleted successfully", "success")
     return redirect(url_for('admin.subjects'))
 
@@ -226,7 +241,7 @@ def delete_subject(subject_id):
 @admin_bp.route('/assign')
 @hod_required
 def assign():
-    with db_cursor() as cur:
+    with db_cursor(read_only=True) as cur:
         cur.execute('SELECT id, name FROM teachers')
         teachers = cur.fetchall()
 
@@ -286,16 +301,21 @@ def do_assign():
         return redirect(url_for('admin.assign'))
 
     with db_cursor(commit=True) as cur:
-        for subject_id in subject_ids:
-            for section_id in section_ids:
-                cur.execute(
-                    'INSERT IGNORE INTO teacher_subjects (teacher_id, subject_id, section_id) VALUES (%s, %s, %s)',
-                    (teacher_id, subject_id, section_id)
-                )
+        bulk_insert(cur, 'teacher_subjects', ('teacher_id', 'subject_id', 'section_id'),
+                    [(teacher_id, subject_id, section_id)
+                     for subject_id in subject_ids for section_id in section_ids],
+                    ignore=True)
+    invalidate_constraints()
 
     flash("Subjects assigned successfully!", "success")
     return redirect(url_for('admin.assign'))
 
+def _repair_message(repaired):
+    if not any(repaired.values()):
+        return ""
+    return (f"Timetable repaired: {repaired['updated']} moved, "
+            f"{repaired['inserted']} added, {repaired['removed']} unscheduled.")
+
 # ✅ DELETE an assignment
 @admin_bp.route('/assign/delete/<int:teacher_id>/<int:subject_id>', methods=['POST'])
 @hod_required
@@ -305,7 +325,9 @@ def delete_assignment(teacher_id, subject_id):
             'DELETE FROM teacher_subjects WHERE teacher_id = %s AND subject_id = %s',
             (teacher_id, subject_id)
         )
-    flash("Assignment deleted successfully!", "success")
+    invalidate_constraints()
+    repaired = repair_assignment(teacher_id, subject_id)
+    flash(f"Assignment deleted successfully! {_repair_message(repaired)}", "success")
     return redirect(url_for('admin.assign'))
 
 # --- Edit an Assignment ---
@@ -340,10 +362,12 @@ def edit_assignment(teacher_id, subject_id):
             with db_cursor(commit=True) as cur2:
                 cur2.execute('DELETE FROM teacher_subjects WHERE teacher_id=%s AND subject_id=%s',
                              (teacher_id, subject_id))
-                for sec_id in new_section_ids:
-                    cur2.execute('INSERT INTO teacher_subjects (teacher_id, subject_id, section_id) VALUES (%s,%s,%s)',
-                                 (teacher_id, subject_id, sec_id))
-            flash("Assignment updated successfully!", "success")
+                bulk_insert(cur2, 'teacher_subjects', ('teacher_id', 'subject_id', 'section_id'),
+                            [(teacher_id, subject_id, sec_id) for sec_id in new_section_ids])
+            invalidate_constraints()
+            # Patch only the affected timetable entries instead of regenerating
+            repaired = repair_assignment(teacher_id, subject_id)
+            flash(f"Assignment updated successfully! {_repair_message(repaired)}", "success")
             return redirect(url_for('admin.assign'))
 
     return render_template(
@@ -372,13 +396,12 @@ def update_assignment(teacher_id, subject_id):
             (teacher_id, subject_id)
         )
         # Insert new assignments
-        for sec_id in new_section_ids:
-            cur.execute(
-                'INSERT INTO teacher_subjects (teacher_id, subject_id, section_id) VALUES (%s, %s, %s)',
-                (teacher_id, subject_id, sec_id)
-            )
+        bulk_insert(cur, 'teacher_subjects', ('teacher_id', 'subject_id', 'section_id'),
+                    [(teacher_id, subject_id, sec_id) for sec_id in new_section_ids])
+    invalidate_constraints()
 
-    flash("Assignment updated successfully!", "success")
+    repaired = repair_assignment(teacher_id, subject_id)
+    flash(f"Assignment updated successfully! {_repair_message(repaired)}", "success")
     return redirect(url_for('admin.assign'))  # Back to main assign page
 
 
@@ -386,104 +409,90 @@ def update_assignment(teacher_id, subject_id):
 @admin_bp.route('/generate', methods=['GET','POST'])
 @hod_required
 def generate():
-    timetable = None
-    course_id = None
-
     # Fetch courses for dropdown
-    with db_cursor() as cur:
+    with db_cursor(read_only=True) as cur:
         cur.execute('SELECT * FROM courses')
         courses = cur.fetchall()
 
     if request.method == 'POST':
         course_id = request.form.get('course_id')
+        engine = request.form.get('engine', 'gemini')
+        if engine not in COURSE_ENGINES:
+            flash(f"Unknown generation engine: {engine}", "danger")
+            return redirect(url_for('admin.generate'))
         if course_id:
-            try:
-                # Fetch course constraints (sections, subjects, teachers)
-                with db_cursor() as cur:
-                    # Sections
-                    cur.execute('SELECT id FROM sections WHERE course_id=%s', (course_id,))
-                    sections = [s['id'] for s in cur.fetchall()]
-                    if not sections:
-                        raise Exception("No sections found for this course")
-
-                    # Subjects
-                    cur.execute('SELECT * FROM subjects WHERE course_id=%s', (course_id,))
-                    subjects = cur.fetchall()
-                    if not subjects:
-                        raise Exception("No subjects found for this course")
-
-                    # Teachers per subject
-                    teacher_map = {}
-                    for subj in subjects:
-                        cur.execute('SELECT teacher_id FROM teacher_subjects WHERE subject_id=%s', (subj['id'],))
-                        t_list = [t['teacher_id'] for t in cur.fetchall()]
-                        if not t_list:
-                            raise Exception(f"No teachers assigned to subject {subj['name']}")
-                        teacher_map[subj['id']] = t_list
-
-                # Build prompt for Gemini
-                constraints = {
-                    "sections": sections,
-                    "subjects": subjects,
-                    "teacher_map": teacher_map
-                }
-                from config import FIXED_SLOTS
-                prompt = build_prompt_from_constraints(constraints, fixed_slots=FIXED_SLOTS)
-
-                # Call Gemini
-                raw_output = call_gemini(prompt)
-                entries = parse_gemini_output(raw_output)
-                valid_entries = validate_entries(entries)
-
-                if not valid_entries:
-                    raise Exception("No valid timetable entries generated by Gemini")
-
-                # Insert into DB
-                with db_cursor(commit=True) as cur:
-                    # Delete old timetable for this course
-                    cur.execute(
-                        'DELETE t FROM timetable_entries t '
-                        'JOIN sections sec ON t.section_id=sec.id '
-                        'WHERE sec.course_id=%s',
-                        (course_id,)
-                    )
-
-                    for e in valid_entries:
-                        cur.execute(
-                            'INSERT INTO timetable_entries '
-                            '(section_id, subject_id, teacher_id, day_of_week, start_time, end_time) '
-                            'VALUES (%s,%s,%s,%s,%s,%s)',
-                            (
-                                e['section_id'], e['subject_id'], e['teacher_id'],
-                                e['day_of_week'], e['start_time'], e['end_time']
-                            )
-                        )
-
-                # Fetch timetable entries for display
-                with db_cursor() as cur:
-                    cur.execute('''
-                        SELECT t.*, s.name AS subject_name, sec.name AS section_name, th.name AS teacher_name
-                        FROM timetable_entries t
-                        LEFT JOIN subjects s ON t.subject_id=s.id
-                        LEFT JOIN sections sec ON t.section_id=sec.id
-                        LEFT JOIN teachers th ON t.teacher_id=th.id
-                        WHERE sec.course_id=%s
-                    ''', (course_id,))
-                    timetable = cur.fetchall()
-
-                # Pre-format times and sort by day/slot
-                for t in timetable:
-                    t['start_time_str'] = safe_fmt_time(t['start_time'])
-                    t['end_time_str'] = safe_fmt_time(t['end_time'])
-
-                timetable.sort(key=lambda x: (x['day_of_week'], x['start_time']))
-
-                flash(f"Timetable generated successfully with ({len(valid_entries)} entries).", "success")
-
-            except Exception as e:
-                flash(f"Error generating timetable: {e}", "danger")
-
-    return render_template('generate.html', courses=courses, timetable=timetable)
+            # Runs on the job pool, the browser polls the job page
+            job_id = submit_job('course', int(course_id), engine, bool(request.form.get('optimize')),
+                                refresh=bool(request.form.get('refresh')))
+            return redirect(url_for('admin.job', job_id=job_id))
+
+    return render_template('generate.html', courses=courses)
+
+# --- GENERATE ALL COURSES ---
+@admin_bp.route('/generate_all', methods=['POST'])
+@hod_required
+def generate_all():
+    engine = request.form.get('engine', 'solver')
+    if engine not in GENERATE_ALL_ENGINES:
+        flash(f"Unknown generation engine: {engine}", "danger")
+        return redirect(url_for('admin.generate'))
+    job_id = submit_job('all', None, engine, bool(request.form.get('optimize')))
+    return redirect(url_for('admin.job', job_id=job_id))
+
+# --- GENERATION JOBS ---
+@admin_bp.route('/jobs/<int:job_id>')
+@hod_required
+def job(job_id):
+    job = get_job(job_id)
+    if not job:
+        flash("Generation job not found", "danger")
+        return redirect(url_for('admin.generate'))
+
+    timetable = None
+    if job['status'] == 'done' and job['course_id']:
+        # Published timetable, already sorted by day/slot with formatted times
+        timetable = course_timetable(job['course_id'])
+
+    return render_template('job.html', job=job, timetable=timetable)
+
+@admin_bp.route('/jobs/<int:job_id>/status')
+@hod_required
+def job_status(job_id):
+    job = get_job(job_id)
+    if not job:
+        return jsonify({'error': 'not found'}), 404
+    return jsonify({k: job[k] for k in ('id', 'kind', 'course_id', 'engine', 'status', 'phase', 'placed', 'message')})
+
+# --- DATABASE STATUS ---
+@admin_bp.route('/db_status')
+@hod_required
+def db_status():
+    # This worker's primary pool (checkouts, waits, wait time, open/idle) and replica health
+    return jsonify({'pool': pool_status(), 'replicas': replica_status()})
+
+# --- TIMETABLE VERSIONS ---
+@admin_bp.route('/versions/<int:course_id>')
+@hod_required
+def versions(course_id):
+    with db_cursor() as cur:
+        cur.execute('SELECT id, name FROM courses WHERE id=%s', (course_id,))
+        course = cur.fetchone()
+        if not course:
+            flash("Course not found", "danger")
+            return redirect(url_for('admin.view_timetable'))
+        history = list_versions(cur, course_id)
+    return render_template('versions.html', course=course, versions=history)
+
+@admin_bp.route('/versions/<int:course_id>/publish', methods=['POST'])
+@hod_required
+def publish_version(course_id):
+    version_id = request.form.get('version_id')
+    try:
+        published = rollback_timetable(course_id, int(version_id) if version_id else None)
+        flash(f"Timetable version {published} is now live", "success")
+    except Exception as e:
+        flash(str(e), "danger")
+    return redirect(url_for('admin.versions', course_id=course_id))
 
 # --- VIEW TIMETABLE ---
 @admin_bp.route('/view_timetable', methods=['GET', 'POST'])
@@ -493,33 +502,13 @@ def view_timetable():
     courses = []
     selected_course_id = None
 
-    with db_cursor() as cur:
+    with db_cursor(read_only=True) as cur:
         cur.execute('SELECT id, name FROM courses')
         courses = cur.fetchall()
 
-        if request.method == 'POST':
-            selected_course_id = int(request.form.get('course_id'))
-            cur.execute('''SELECT t.*, s.name AS subject_name, sec.name AS section_name, th.name AS teacher_name
-                           FROM timetable_entries t
-                           LEFT JOIN subjects s ON t.subject_id=s.id
-                           LEFT JOIN sections sec ON t.section_id=sec.id
-                           LEFT JOIN teachers th ON t.teacher_id=th.id
-                           WHERE sec.course_id=%s''', (selected_course_id,))
-            timetable = cur.fetchall()
-
-    # Sort timetable by day_of_week and start_time
-    from utils import safe_fmt_time, time_to_minutes
-    day_order = {'Monday':0,'Tuesday':1,'Wednesday':2,'Thursday':3,'Friday':4,'Saturday':5,'Sunday':6}
-    day_names = ["Monday","Tuesday","Wednesday","Thursday","Friday","Saturday","Sunday"]
-
-    def safe_minutes(val):
-        val_str = safe_fmt_time(val)
-        return time_to_minutes(val_str) if val_str else 0
-
-    timetable.sort(key=lambda t: (day_order.get(day_names[t['day_of_week']],7), safe_minutes(t['start_time'])))
-
-    for e in timetable:
-        e['start_time'] = safe_fmt_time(e['start_time'])
-        e['end_time'] = safe_fmt_time(e['end_time'])
+    if request.method == 'POST':
+        selected_course_id = int(request.form.get('course_id'))
+        # Cached per published version, sorted by day/start with formatted times
+        timetable = course_timetable(selected_course_id)
 
     return render_template('timetable_view.html', courses=courses, timetable=timetable, selected_course_id=selected_course_id)
@@ -1,8 +1,8 @@
 from flask import Blueprint, request, send_file, flash, redirect, url_for
-from db import db_cursor
+from versions import course_timetable
 from io import BytesIO
 import pandas as pd
-from utils import safe_fmt_time
+from utils import minutes_to_hhmm
 
 export_bp = Blueprint('export', __name__, url_prefix='/export')
 
@@ -13,8 +13,8 @@ def export_timetable(entries, fmt='xlsx'):
     data = []
     for t in entries:
         day = day_names[t['day_of_week']] if t['day_of_week'] is not None else ''
-        start = safe_fmt_time(t['start_time'])
-        end = safe_fmt_time(t['end_time'])
+        start = minutes_to_hhmm(t['start_min'])
+        end = minutes_to_hhmm(t['end_min'])
         data.append({
             "Day": day,
             "Section": t.get('section_name',''),
@@ -40,27 +40,12 @@ def export_timetable(entries, fmt='xlsx'):
 @export_bp.route('/course/<int:course_id>')
 def export_course(course_id):
     fmt = request.args.get('format','xlsx')
-    with db_cursor() as cur:
-        cur.execute('''SELECT t.*, s.name AS subject_name, sec.name AS section_name, th.name AS teacher_name
-                       FROM timetable_entries t
-                       LEFT JOIN subjects s ON t.subject_id=s.id
-                       LEFT JOIN sections sec ON t.section_id=sec.id
-                       LEFT JOIN teachers th ON t.teacher_id=th.id
-                       WHERE sec.course_id=%s''', (course_id,))
-        entries = cur.fetchall()
+    # Already sorted by day and start_time like the view
+    entries = course_timetable(course_id)
 
     if not entries:
         flash("No timetable entries found for export","warning")
         return redirect(url_for('admin.view_timetable'))
 
-    # --- Sort by day and start_time like view ---
-    day_order = {'Monday':0,'Tuesday':1,'Wednesday':2,'Thursday':3,'Friday':4,'Saturday':5,'Sunday':6}
-    def safe_minutes(val):
-        val_str = safe_fmt_time(val)
-        from utils import time_to_minutes
-        return time_to_minutes(val_str) if val_str else 0
-    entries.sort(key=lambda t: (day_order.get(["Monday","Tuesday","Wednesday","Thursday","Friday","Saturday","Sunday"][t['day_of_week']],7),
-                                safe_minutes(t['start_time'])))
-
     buf, mimetype, fname = export_timetable(entries, fmt)
     return send_file(buf, mimetype=mimetype, as_attachment=True, download_name=fname)
@@ -1,7 +1,6 @@
 from flask import Blueprint, redirect, render_template, session, url_for
-from db import db_cursor
+from versions import teacher_timetable
 from functools import wraps
-from utils import safe_fmt_time
 
 teacher_bp = Blueprint('teacher', __name__, url_prefix='/teacher')
 
@@ -17,17 +16,7 @@ def teacher_required(f):
 @teacher_required
 def teacher_dashboard():
     teacher_id = session.get('teacher_id')
-    with db_cursor() as cur:
-        cur.execute('''
-            SELECT t.day_of_week, sec.name AS section_name, s.name AS subject_name,
-                   t.start_time, t.end_time
-            FROM timetable_entries t
-            LEFT JOIN subjects s ON t.subject_id=s.id
-            LEFT JOIN sections sec ON t.section_id=sec.id
-            WHERE t.teacher_id=%s
-            ORDER BY t.day_of_week, t.start_time, sec.name
-        ''', (teacher_id,))
-        rows = cur.fetchall()
+    rows = teacher_timetable(teacher_id)
 
     # Map days
     day_map = {0:'Monday', 1:'Tuesday', 2:'Wednesday', 3:'Thursday', 4:'Friday', 5:'Saturday', 6:'Sunday'}
@@ -43,8 +32,8 @@ def teacher_dashboard():
             timetable[sec][day] = []
         timetable[sec][day].append({
             'subject_name': r['subject_name'],
-            'start_time': safe_fmt_time(r['start_time']),
-            'end_time': safe_fmt_time(r['end_time'])
+            'start_min': r['start_min'],
+            'end_min': r['end_min']
         })
 
     # Get sorted list of days for table header
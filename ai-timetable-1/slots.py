@@ -0,0 +1,76 @@
+from typing import NamedTuple
+from config import FIXED_SLOTS, LUNCH_BREAK, LAB_SLOT_SPAN
+from occupancy import interval_mask
+from utils import time_to_minutes, minutes_to_hhmm
+
+
+class Slot(NamedTuple):
+    start_min: int
+    end_min: int
+    mask: int    # minute bitmask, see occupancy.interval_mask
+    id: int      # index into SlotGrid.slots
+    is_lab: bool
+
+
+class SlotGrid:
+    """
+    The institution's teaching periods, precomputed once:
+    - Lecture slots: every period that does not touch a blocked period (lunch)
+    - Lab slots: runs of `lab_span` back-to-back periods, never across a blocked period
+    - Every slot has an integer id; lookups by id, (start, end) or start are O(1)
+    """
+
+    def __init__(self, periods, blocked=(), lab_span=2):
+        periods = sorted(periods)
+        self.blocked = tuple(sorted(blocked))
+        self.blocked_mask = 0
+        for start, end in self.blocked:
+            self.blocked_mask |= interval_mask(start, end)
+
+        slots = []
+        def add(start, end, is_lab):
+            mask = interval_mask(start, end)
+            if not mask & self.blocked_mask:
+                slots.append(Slot(start, end, mask, len(slots), is_lab))
+
+        for start, end in periods:
+            add(start, end, False)
+        for i in range(len(periods) - lab_span + 1):
+            run = periods[i:i + lab_span]
+            if all(a[1] == b[0] for a, b in zip(run, run[1:])):
+                add(run[0][0], run[-1][1], True)
+
+        self.slots = tuple(slots)
+        self.lectures = tuple(s for s in slots if not s.is_lab)
+        self.labs = tuple(s for s in slots if s.is_lab)
+        self._by_bounds = {(s.start_min, s.end_min): s for s in slots}
+        self._by_start = {(s.is_lab, s.start_min): s for s in slots}
+
+    @classmethod
+    def from_config(cls):
+        periods = [(time_to_minutes(s), time_to_minutes(e)) for s, e in FIXED_SLOTS]
+        blocked = [(time_to_minutes(LUNCH_BREAK[0]), time_to_minutes(LUNCH_BREAK[1]))]
+        return cls(periods, blocked, LAB_SLOT_SPAN)
+
+    def for_subject(self, subj):
+        """Candidate slots for a subject row."""
+        return self.labs if subj['is_lab'] else self.lectures
+
+    def find(self, start_min, end_min):
+        """The slot spanning exactly [start_min, end_min), or None if that is not a valid slot."""
+        return self._by_bounds.get((start_min, end_min))
+
+    def starting_at(self, start_min, is_lab):
+        return self._by_start.get((bool(is_lab), start_min))
+
+    def blocked_minutes(self, start_min, end_min):
+        """Minutes of [start_min, end_min) that fall in blocked periods."""
+        return (interval_mask(start_min, end_min) & self.blocked_mask).bit_count()
+
+    def describe(self):
+        """Lecture slots and lab blocks as 'HH:MM' pairs (for prompts)."""
+        return ([(minutes_to_hhmm(s.start_min), minutes_to_hhmm(s.end_min)) for s in self.lectures],
+                [(minutes_to_hhmm(s.start_min), minutes_to_hhmm(s.end_min)) for s in self.labs])
+
+
+GRID = SlotGrid.from_config()
@@ -0,0 +1,176 @@
+from collections import Counter
+from occupancy import Occupancy
+from slots import GRID
+
+DAYS = range(5)  # Monday-Friday
+MAX_NODES = 200000
+
+class SolverError(Exception):
+    """Solver gave up; `reasons` lists the constraints that blocked it."""
+
+    def __init__(self, message, reasons=None):
+        super().__init__(message)
+        self.reasons = reasons or []
+
+class Unsatisfiable(SolverError):
+    """The constraints admit no complete timetable."""
+
+def solve_course(sections, subjects, teacher_map, occupancy=None, max_nodes=MAX_NODES):
+    """
+    Complete backtracking solver, one entry per (section, subject):
+    - Domains: every (day, slot, teacher of that section in `teacher_map`) still free in `occupancy`
+    - MRV: branch on the event with the fewest candidates left
+    - Forward checking: prune teacher/section neighbours after each assignment
+    - Backtrack on dead ends, deterministic (no randomness)
+    Returns entries like greedy_schedule().
+    Raises Unsatisfiable with reasons when no complete timetable exists,
+    SolverError when `max_nodes` runs out first.
+    """
+    occupancy = occupancy or Occupancy()
+    events = []   # (section_id, subject)
+    domains = []  # per event: list of (day, start_min, end_min, mask, teacher_id)
+    for section_id in sections:
+        for subj in subjects:
+            slots = GRID.for_subject(subj)
+            events.append((section_id, subj))
+            domains.append([
+                (day, slot.start_min, slot.end_min, slot.mask, tid)
+                for tid in teacher_map.get((subj['id'], section_id), [])
+                for day in DAYS
+                for slot in occupancy.free_slots(slots, day, teacher_id=tid, section_id=section_id)
+            ])
+
+    reasons = _static_conflicts(events, domains, occupancy)
+    if reasons:
+        raise Unsatisfiable("Constraints cannot be satisfied", reasons)
+
+    # Events that share a section or a candidate teacher constrain each other
+    by_section, by_teacher = {}, {}
+    for i, (section_id, subj) in enumerate(events):
+        by_section.setdefault(section_id, set()).add(i)
+        for tid in teacher_map.get((subj['id'], section_id), []):
+            by_teacher.setdefault(tid, set()).add(i)
+    neighbours = []
+    for i, (section_id, subj) in enumerate(events):
+        linked = set(by_section[section_id])
+        for tid in teacher_map.get((subj['id'], section_id), []):
+            linked |= by_teacher[tid]
+        linked.discard(i)
+        neighbours.append(linked)
+
+    assignment = [None] * len(events)
+    failures = Counter()
+    nodes = 0
+
+    def prune(i, cand):
+        """Drop neighbour candidates that clash with `cand`; returns (trail, wiped_event)."""
+        day, _, _, mask, tid = cand
+        section_id = events[i][0]
+        left = occupancy.minutes_left(tid)
+        trail = []
+        for j in neighbours[i]:
+            if assignment[j] is not None:
+                continue
+            same_section = events[j][0] == section_id
+            dom = domains[j]
+            kept = [c for c in dom
+                    if not (c[0] == day and c[3] & mask and (same_section or c[4] == tid))
+                    and not (c[4] == tid and c[2] - c[1] > left)]
+            if len(kept) != len(dom):
+                trail.append((j, dom))
+                domains[j] = kept
+                if not kept:
+                    return trail, j
+        return trail, None
+
+    def ordered(i):
+        # Least-loaded day first keeps the week balanced
+        section_id = events[i][0]
+        return sorted(domains[i], key=lambda c: (
+            occupancy.busy(c[0], section_id=section_id).bit_count(),
+            occupancy.busy(c[0], teacher_id=c[4]).bit_count(),
+            c[0], c[1]))
+
+    def search(remaining):
+        nonlocal nodes
+        if not remaining:
+            return True
+        i = min(remaining, key=lambda k: (len(domains[k]), -len(neighbours[k]), k))
+        remaining.remove(i)
+        section_id = events[i][0]
+        for cand in ordered(i):
+            nodes += 1
+            if nodes > max_nodes:
+                raise SolverError(f"Search limit of {max_nodes} nodes reached",
+                                  _hardest(events, teacher_map, failures))
+            day, _, _, mask, tid = cand
+            assignment[i] = cand
+            occupancy.reserve(day, mask, teacher_id=tid, section_id=section_id)
+            trail, wiped = prune(i, cand)
+            if wiped is None and search(remaining):
+                return True
+            if wiped is not None:
+                failures[wiped] += 1
+            for j, dom in reversed(trail):
+                domains[j] = dom
+            occupancy.release(day, mask, teacher_id=tid, section_id=section_id)
+            assignment[i] = None
+        remaining.add(i)
+        failures[i] += 1
+        return False
+
+    if not search(set(range(len(events)))):
+        raise Unsatisfiable("Search exhausted without a complete timetable",
+                            _hardest(events, teacher_map, failures))
+
+    return [(events[i][0], events[i][1]['id'], cand[4], cand[0], cand[1], cand[2])
+            for i, cand in enumerate(assignment)]
+
+def _label(event):
+    section_id, subj = event
+    return f"section {section_id} / subject {subj['name']}"
+
+def _static_conflicts(events, domains, occupancy):
+    """
+    Cheap necessary conditions checked before searching:
+    - Every event has at least one candidate
+    - Per section: minutes needed fit in the minutes its candidates cover
+    - Per sole teacher: same check over the events only they can teach,
+      plus their remaining weekly hours
+    """
+    reasons = []
+    for event, dom in zip(events, domains):
+        if not dom:
+            reasons.append(f"{_label(event)}: no teacher is free in any slot")
+    if reasons:
+        return reasons
+
+    groups, limits = {}, {}
+    for i, (section_id, _) in enumerate(events):
+        groups.setdefault(f"section {section_id}", []).append(i)
+        teachers = {c[4] for c in domains[i]}
+        if len(teachers) == 1:
+            tid = teachers.pop()
+            groups.setdefault(f"teacher {tid}", []).append(i)
+            limits[f"teacher {tid}"] = occupancy.minutes_left(tid)
+
+    for name, idx in groups.items():
+        needed = sum(min(c[2] - c[1] for c in domains[i]) for i in idx)
+        if needed > limits.get(name, float('inf')):
+            reasons.append(f"{name}: needs {needed} min but only {limits[name]} min of weekly hours are left")
+            continue
+        covered = {}
+        for i in idx:
+            for c in domains[i]:
+                covered[c[0]] = covered.get(c[0], 0) | c[3]
+        available = sum(mask.bit_count() for mask in covered.values())
+        if needed > available:
+            reasons.append(f"{name}: needs {needed} min but only {available} min of slots are free")
+    return reasons
+
+def _hardest(events, teacher_map, failures, limit=5):
+    return [
+        f"{_label(events[i])} (teachers {teacher_map.get((events[i][1]['id'], events[i][0]), [])}) "
+        f"failed {count} times"
+        for i, count in failures.most_common(limit)
+    ]
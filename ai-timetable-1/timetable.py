@@ -1,124 +1,481 @@
-from db import db_cursor
-from utils import FIXED_SLOTS, time_to_minutes
+from db import db_cursor, named_lock
+from occupancy import Occupancy, interval_mask, load_teacher_availability, load_teacher_occupancy
+from slots import GRID
+from cache import invalidate_timetables
+from constraints import course_constraints, load_constraints, merged_availability
+from versions import (COURSE_ENTRIES, PUBLISHED_ENTRIES, create_version, publish_version, published_version,
+                      list_versions, prune_versions)
+from gemini import EntryValidator, sharded_gemini_entries
+from solver import solve_course
+from optimizer import improve, penalty
+from concurrent.futures import ProcessPoolExecutor
+from config import GENERATION_RUNS, GENERATION_WORKERS
+import multiprocessing
 import random
 
-def generate_timetable_for_course(course_id: int) -> int:
+# Generation pools never fork the web/job process itself (its threads, locks and pooled connections);
+# workers start from a clean forkserver, or spawn where forkserver is not available
+POOL_CONTEXT = multiprocessing.get_context(
+    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+
+# Engines (mode) accepted for one course, and for all courses at once
+COURSE_ENGINES = ('gemini', 'solver', 'multistart', 'greedy')
+GENERATE_ALL_ENGINES = ('solver', 'greedy')
+
+def generate_timetable_for_course(course_id: int, mode: str = 'greedy', optimize: bool = False, progress=None,
+                                  refresh: bool = False) -> int:
     """
     Auto-generation algorithm:
     - Fetch sections, subjects, teachers
     - Loop days and slots
-    - Assign teachers without overlaps
+    - Assign teachers without overlaps (including their other courses)
     - Dynamic lab scheduling
+    mode='greedy' is the randomized single pass (may drop subjects),
+    mode='solver' is the complete backtracking solver (all or Unsatisfiable).
+    mode='multistart' runs GENERATION_RUNS seeded greedy passes in parallel, keeps the best.
+    mode='gemini' asks Gemini (concurrently per group of sections) and keeps only the entries that
+    pass validation; unchanged constraints reuse the cached Gemini result unless refresh=True.
+    optimize=True runs the time-budgeted soft-constraint optimizer afterwards.
+    progress(phase, placed=None) is called between pipeline steps.
+    """
+    progress = progress or (lambda phase, placed=None: None)
+    if mode == 'gemini':
+        return _generate_with_gemini(course_id, progress, refresh)
+
+    # One writer per course; the lock is released only after the commit
+    with course_lock(course_id), db_cursor(commit=True) as cur:
+        progress('loading constraints')
+        model, busy = _course_model(cur, course_id)
+        progress('solving')
+        entries = _schedule(model.sections, model.subjects, model.teacher_map, busy, mode, optimize)
+
+        progress('saving', len(entries))
+        _save_entries(cur, course_id, entries, source=mode)
+
+    _after_publish([course_id])
+    return len(entries)
+
+def _course_model(cur, course_id):
+    """Checked constraints of a course, and its teachers' availability, weekly hours and other courses' slots."""
+    model = course_constraints(cur, course_id)
+    busy = model.availability.copy()
+    load_teacher_occupancy(cur, model.teacher_ids(), exclude_course_id=course_id, occupancy=busy)
+    return model, busy
+
+def _generate_with_gemini(course_id, progress, refresh):
+    """
+    Gemini generation without holding a connection, transaction or lock during the network calls:
+    - Load constraints and occupancy, release the cursor
+    - Ask Gemini
+    - Take the course lock and write transaction, reload the occupancy and keep only
+      entries that are still free (other courses may have been published meanwhile)
+    """
+    progress('loading constraints')
+    with db_cursor() as cur:
+        model, busy = _course_model(cur, course_id)
+    entries = _gemini_schedule(model.sections, model.subjects, model.teacher_map, busy, progress, refresh)
+
+    with course_lock(course_id), db_cursor(commit=True) as cur:
+        progress('saving', len(entries))
+        _, busy = _course_model(cur, course_id)
+        entries = _still_free(entries, busy)
+        if not entries:
+            raise Exception("Every Gemini entry clashes with timetables published while it was generating")
+        _save_entries(cur, course_id, entries, source='gemini')
+
+    _after_publish([course_id])
+    return len(entries)
+
+def _still_free(entries, occupancy):
+    """The entries that still fit `occupancy` (modified), in order."""
+    kept = []
+    for entry in entries:
+        section_id, _, teacher_id, day, start_min, end_min = entry
+        mask = interval_mask(start_min, end_min)
+        if occupancy.fits(day, mask, teacher_id=teacher_id, section_id=section_id):
+            occupancy.reserve(day, mask, teacher_id=teacher_id, section_id=section_id)
+            kept.append(entry)
+    return kept
+
+def course_lock(*course_ids):
+    return named_lock(*(f"timetable_course_{c}" for c in course_ids))
+
+def _gemini_schedule(sections, subjects, teacher_map, busy, progress, refresh=False):
+    # Build prompt for Gemini
+    constraints = {
+        "sections": sections,
+        "subjects": subjects,
+        "teacher_map": teacher_map
+    }
+    lectures, labs = GRID.describe()
+
+    # Call Gemini, one streamed request per group of sections (or reuse cached answers for the same constraints).
+    # Global merge: every arriving entry is validated and reserved against `busy` and all other shards
+    progress('calling gemini')
+    validator = EntryValidator(busy, sections=sections, subjects=subjects, teacher_map=teacher_map)
+    valid_entries = sharded_gemini_entries(
+        constraints, fixed_slots=lectures, lab_blocks=labs, refresh=refresh, validator=validator,
+        progress=lambda done, total, placed: progress(f'gemini {done}/{total} shards', placed))
+    report = validator.report()
+    if report.rejected:
+        print(f"[Gemini] Rejected entries: {report.summary()}")
+    if not valid_entries:
+        raise Exception(f"No valid timetable entries generated by Gemini ({report.summary()})")
+
+    return [(e['section_id'], e['subject_id'], e['teacher_id'], e['day_of_week'], e['start_min'], e['end_min'])
+            for e in valid_entries]
+
+def _schedule(sections, subjects, teacher_map, busy, mode, optimize):
+    """Run the chosen engine against `busy` (not modified)."""
+    if mode == 'solver':
+        entries = solve_course(sections, subjects, teacher_map, occupancy=busy.copy())
+        if optimize:
+            entries = improve(entries, subjects, teacher_map, occupancy=busy)
+    elif mode == 'multistart':
+        entries = best_of_runs(sections, subjects, teacher_map, occupancy=busy, optimize=optimize)
+    else:
+        entries = greedy_schedule(sections, subjects, teacher_map, occupancy=busy.copy())
+        if optimize:
+            entries = improve(entries, subjects, teacher_map, occupancy=busy)
+    return entries
+
+def _save_entries(cur, course_id, entries, source):
+    """Write entries as a new version and publish it; the previous version stays for rollback."""
+    version_id = create_version(cur, course_id, entries, source)
+    publish_version(cur, course_id, version_id)
+    return version_id
+
+def _after_publish(course_ids):
+    """
+    Once the publishing transaction has committed: drop cached views, apply version retention.
+    Retention runs under the course locks, so it cannot race a rollback of the same courses.
+    """
+    invalidate_timetables()
+    if not course_ids:
+        return
+    with course_lock(*course_ids), db_cursor(commit=True) as cur:
+        prune_versions(cur, course_ids)
+
+def rollback_timetable(course_id: int, version_id: int = None) -> int:
+    """
+    Re-publish an older version of a course's timetable (pointer update only, no solve).
+    Without version_id, goes back to the version before the published one.
+    Returns the now published version id.
     """
-    with db_cursor(commit=True) as cur:
-        # Fetch sections
-        cur.execute('SELECT id FROM sections WHERE course_id=%s', (course_id,))
-        sections = [s['id'] for s in cur.fetchall()]
-        if not sections:
-            raise Exception("No sections found")
-
-        # Fetch subjects
-        cur.execute('SELECT * FROM subjects WHERE course_id=%s', (course_id,))
-        subjects = cur.fetchall()
-        if not subjects:
-            raise Exception("No subjects found")
-
-        # Map subjects to teachers
-        teacher_map = {}
+    with course_lock(course_id), db_cursor(commit=True) as cur:
+        current = published_version(cur, course_id)
+        versions = [v['id'] for v in list_versions(cur, course_id)]
+        if version_id is None:
+            older = [v for v in versions if current is None or v < current]
+            if not older:
+                raise Exception("No earlier timetable version to roll back to")
+            version_id = older[0]
+        elif version_id not in versions:
+            raise Exception(f"Timetable version {version_id} does not belong to this course")
+        publish_version(cur, course_id, version_id)
+    invalidate_timetables()
+    return version_id
+
+def greedy_schedule(sections, subjects, teacher_map, occupancy=None, rng=None):
+    """
+    Randomized greedy placement, one entry per (section, subject),
+    with the teachers `teacher_map` assigns to that section (see CourseConstraints).
+    Returns a list of (section_id, subject_id, teacher_id, day, start_min, end_min).
+    Subjects with no free slot on any day are skipped.
+    """
+    occupancy = occupancy or Occupancy()
+    rng = rng or random
+    entries = []
+    days = list(range(5))  # Monday-Friday
+
+    for section_id in sections:
         for subj in subjects:
-            cur.execute('SELECT teacher_id FROM teacher_subjects WHERE subject_id=%s', (subj['id'],))
-            teacher_map[subj['id']] = [t['teacher_id'] for t in cur.fetchall()]
-            if not teacher_map[subj['id']]:
-                raise Exception(f"No teachers assigned to subject {subj['name']}")
+            rng.shuffle(days)
+
+            for day in days:
+                possible_slots = []
+                # Lecture slot or lab block where both teacher and section are free
+                for tid in teacher_map[(subj['id'], section_id)]:
+                    for slot in occupancy.free_slots(GRID.for_subject(subj), day, teacher_id=tid, section_id=section_id):
+                        possible_slots.append((slot.start_min, slot.end_min, slot.mask, tid))
+                if not possible_slots:
+                    continue
+
+                start_min, end_min, mask, teacher_id = rng.choice(possible_slots)
+                entries.append((section_id, subj['id'], teacher_id, day, start_min, end_min))
+                occupancy.reserve(day, mask, teacher_id=teacher_id, section_id=section_id)
+                break  # move to next subject
+
+    return entries
+
+def score(entries, subjects):
+    """Sort key for candidate timetables: more entries first, then lower soft penalty."""
+    return (-len(entries), penalty(entries, subjects))
+
+def _seeded_run(args):
+    sections, subjects, teacher_map, occupancy, seed, optimize = args
+    rng = random.Random(seed)
+    entries = greedy_schedule(sections, subjects, teacher_map,
+                              occupancy=occupancy.copy() if occupancy else None, rng=rng)
+    if optimize:
+        entries = improve(entries, subjects, teacher_map, occupancy=occupancy, rng=rng)
+    return score(entries, subjects), entries
+
+def best_of_runs(sections, subjects, teacher_map, occupancy=None, runs=None, workers=None,
+                 optimize=False, seed=None):
+    """
+    Multi-start generation:
+    - `runs` independently seeded greedy passes (optionally optimized)
+    - Spread over a process pool, one worker per core by default
+    - `occupancy` is pre-existing busy time, copied per run
+    - Returns the best run by score()
+    """
+    runs = runs or GENERATION_RUNS
+    workers = min(workers or GENERATION_WORKERS, runs)
+    base = random.SystemRandom().randrange(2**32) if seed is None else seed
+    jobs = [(sections, subjects, teacher_map, occupancy, base + i, optimize) for i in range(runs)]
+    if workers <= 1:
+        results = map(_seeded_run, jobs)
+    else:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=POOL_CONTEXT) as pool:
+            results = list(pool.map(_seeded_run, jobs))
+    return min(results, key=lambda r: r[0])[1]
+
+def repair_assignment(teacher_id: int, subject_id: int) -> dict:
+    """
+    Incremental repair after a (teacher, subject) assignment changes:
+    - Unschedule only this teacher's entries in sections they no longer teach
+    - Re-place them against the existing occupancy (same slot, other teacher first)
+    - Schedule sections newly covered by the assignment
+    - Publish a new version: the published one copied server-side, with only the changed entries rewritten
+    Returns counts of updated, inserted and removed entries.
+    """
+    summary = {'updated': 0, 'inserted': 0, 'removed': 0}
+    with db_cursor() as cur:
+        cur.execute('SELECT id, course_id, is_lab FROM subjects WHERE id=%s', (subject_id,))
+        subj = cur.fetchone()
+    if not subj or subj['course_id'] is None:
+        return summary
+
+    with course_lock(subj['course_id']), db_cursor(commit=True) as cur:
+        cur.execute('SELECT id FROM sections WHERE course_id=%s', (subj['course_id'],))
+        course_sections = [s['id'] for s in cur.fetchall()]
+
+        # section_id -> teachers; a NULL section means every section of the course
+        cur.execute('SELECT teacher_id, section_id FROM teacher_subjects WHERE subject_id=%s', (subject_id,))
+        assigned = {}
+        for r in cur.fetchall():
+            for sec in ([r['section_id']] if r['section_id'] is not None else course_sections):
+                assigned.setdefault(sec, set()).add(r['teacher_id'])
 
-        # Clear old timetable entries
         cur.execute(
-            'DELETE t FROM timetable_entries t '
-            'JOIN sections sec ON t.section_id=sec.id '
-            'WHERE sec.course_id=%s',
-            (course_id,)
+            'SELECT t.id, t.version_id, t.section_id, t.subject_id, t.teacher_id, t.day_of_week, t.start_min, t.end_min '
+            'FROM timetable_entries t WHERE ' + COURSE_ENTRIES, (subj['course_id'],)
         )
+        course_entries = cur.fetchall()
+        if not course_entries:
+            return summary  # no timetable yet, nothing to repair
 
-        entries = []
-        teacher_schedule = {}  # (teacher_id, day) -> list of (start,end)
-        section_schedule = {}  # (section_id, day) -> list of (start,end)
-        days = list(range(5))  # Monday-Friday
-
-        for section_id in sections:
-            for subj in subjects:
-                random.shuffle(days)
-                scheduled = False
-
-                for day in days:
-                    # Prepare schedules
-                    t_key = (subj['id'], day)  # temp for checking teachers
-                    section_key = (section_id, day)
-                    teacher_schedule.setdefault(day, {})
-                    section_schedule.setdefault(day, {})
-                    section_schedule.setdefault(section_key, [])
-                    
-                    # Determine slots
-                    if subj['is_lab']:
-                        # pick any 120-min slot outside lunch (12:30-13:30)
-                        possible_slots = []
-                        for slot_start, slot_end in FIXED_SLOTS:
-                            slot_start_min = time_to_minutes(slot_start)
-                            slot_end_min = time_to_minutes(slot_end)
-                            # lab needs 120 min
-                            lab_end = slot_start_min + 120
-                            # skip if overlaps lunch
-                            if not (lab_end <= 750 or slot_start_min >= 810):  # 12:30-13:30 = 750-810
-                                continue
-                            # check teacher availability
-                            for tid in teacher_map[subj['id']]:
-                                teacher_schedule.setdefault(tid, {}).setdefault(day, [])
-                                conflict = any(
-                                    not (lab_end <= s or slot_start_min >= e)
-                                    for s, e in teacher_schedule[tid][day]
-                                )
-                                if conflict:
-                                    continue
-                                possible_slots.append((slot_start_min, lab_end, tid))
-                        if not possible_slots:
-                            continue
-                        start_min, end_min, teacher_id = random.choice(possible_slots)
-                    else:
-                        # Theory: pick any FIXED_SLOT where teacher free
-                        possible_slots = []
-                        for slot_start, slot_end in FIXED_SLOTS:
-                            start_min = time_to_minutes(slot_start)
-                            end_min = time_to_minutes(slot_end)
-                            for tid in teacher_map[subj['id']]:
-                                teacher_schedule.setdefault(tid, {}).setdefault(day, [])
-                                section_schedule.setdefault((section_id, day), [])
-                                # check teacher overlap
-                                t_conflict = any(not (end_min <= s or start_min >= e)
-                                                 for s, e in teacher_schedule[tid][day])
-                                # check section overlap
-                                s_conflict = any(not (end_min <= s or start_min >= e)
-                                                 for s, e in section_schedule[(section_id, day)])
-                                if not t_conflict and not s_conflict:
-                                    possible_slots.append((start_min, end_min, tid))
-                        if not possible_slots:
-                            continue
-                        start_min, end_min, teacher_id = random.choice(possible_slots)
-
-                    # Save entry
-                    entries.append((section_id, subj['id'], teacher_id, day, start_min, end_min))
-                    # Update schedules
-                    teacher_schedule[teacher_id][day].append((start_min, end_min))
-                    section_schedule[(section_id, day)].append((start_min, end_min))
-                    scheduled = True
-                    break  # move to next subject
-
-        # Insert entries into DB
-        for section_id, subj_id, teacher_id, day, start_min, end_min in entries:
-            cur.execute(
-                'INSERT INTO timetable_entries (section_id,subject_id,teacher_id,day_of_week,start_time,end_time) '
-                'VALUES (%s,%s,%s,%s,%s,%s)',
-                (section_id, subj_id, teacher_id, day,
-                 f"{start_min//60:02d}:{start_min%60:02d}:00",
-                 f"{end_min//60:02d}:{end_min%60:02d}:00")
-            )
+        subject_entries = [e for e in course_entries if e['subject_id'] == subject_id]
+        stale = [e for e in subject_entries
+                 if e['teacher_id'] == teacher_id and teacher_id not in assigned.get(e['section_id'], ())]
+        covered = {e['section_id'] for e in subject_entries}
+        missing = [sec for sec in course_sections
+                   if sec not in covered and teacher_id in assigned.get(sec, ())]
+        if not stale and not missing:
+            return summary
 
-    return len(entries)
+        # Existing occupancy: this course's sections plus every involved teacher everywhere
+        stale_ids = {e['id'] for e in stale}
+        teachers = set()
+        for sec in {e['section_id'] for e in stale} | set(missing):
+            teachers |= assigned.get(sec, set())
+        occupancy = load_teacher_availability(cur, teachers)
+        load_teacher_occupancy(cur, teachers, exclude_course_id=subj['course_id'], occupancy=occupancy)
+        for e in course_entries:
+            if e['id'] in stale_ids:
+                continue
+            mask = interval_mask(e['start_min'], e['end_min'])
+            occupancy.reserve(e['day_of_week'], mask, teacher_id=e['teacher_id'], section_id=e['section_id'])
+
+        slots = GRID.for_subject(subj)
+        new_rows = []
+        for e in stale:
+            sec = e['section_id']
+            options = sorted(assigned.get(sec, ()))
+            day = e['day_of_week']
+            start_min, end_min = e['start_min'], e['end_min']
+            mask = interval_mask(start_min, end_min)
+            # Prefer keeping the slot and swapping the teacher
+            tid = next((t for t in options if occupancy.fits(day, mask, teacher_id=t, section_id=sec)), None)
+            placed = (tid, day, start_min, end_min, mask) if tid is not None else _first_fit(occupancy, sec, slots, options)
+            if placed is None:
+                summary['removed'] += 1
+                continue
+            tid, day, start_min, end_min, mask = placed
+            occupancy.reserve(day, mask, teacher_id=tid, section_id=sec)
+            new_rows.append((sec, subject_id, tid, day, start_min, end_min))
+            summary['updated'] += 1
+
+        for sec in missing:
+            placed = _first_fit(occupancy, sec, slots, [teacher_id])
+            if placed is None:
+                continue
+            tid, day, start_min, end_min, mask = placed
+            occupancy.reserve(day, mask, teacher_id=tid, section_id=sec)
+            new_rows.append((sec, subject_id, tid, day, start_min, end_min))
+            summary['inserted'] += 1
+
+        version_id = create_version(cur, subj['course_id'], new_rows, 'repair',
+                                    copy_from=course_entries[0]['version_id'], skip_ids=stale_ids)
+        publish_version(cur, subj['course_id'], version_id)
+
+    _after_publish([subj['course_id']])
+    return summary
+
+def _first_fit(occupancy, section_id, slots, teachers):
+    """First free (teacher, day, start, end, mask), trying the section's lightest days first."""
+    days = sorted(range(5), key=lambda d: occupancy.busy(d, section_id=section_id).bit_count())
+    for day in days:
+        for tid in teachers:
+            for slot in occupancy.free_slots(slots, day, teacher_id=tid, section_id=section_id):
+                return tid, day, slot.start_min, slot.end_min, slot.mask
+    return None
+
+def course_components(cur):
+    """
+    Split courses into groups that share no teacher:
+    - Graph: courses linked through teacher_subjects (one query)
+    - Union-find over teachers, courses without teachers stand alone
+    Returns a list of course-id lists, largest first.
+    """
+    cur.execute('SELECT id FROM courses')
+    parent = {c['id']: c['id'] for c in cur.fetchall()}
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    cur.execute(
+        'SELECT DISTINCT ts.teacher_id, s.course_id '
+        'FROM teacher_subjects ts JOIN subjects s ON ts.subject_id=s.id '
+        'WHERE s.course_id IS NOT NULL'
+    )
+    first_course = {}  # teacher_id -> a course they teach in
+    for r in cur.fetchall():
+        if r['course_id'] not in parent:
+            continue
+        other = first_course.setdefault(r['teacher_id'], r['course_id'])
+        parent[find(r['course_id'])] = find(other)
+
+    groups = {}
+    for course_id in parent:
+        groups.setdefault(find(course_id), []).append(course_id)
+    return sorted((sorted(g) for g in groups.values()), key=len, reverse=True)
+
+def _reserve_entries(occupancy, entries):
+    for section_id, _, teacher_id, day, start_min, end_min in entries:
+        occupancy.reserve(day, interval_mask(start_min, end_min), teacher_id=teacher_id, section_id=section_id)
+
+def _solve_component(args):
+    """
+    Solve the courses of one component in turn against a shared occupancy.
+    A course that fails keeps its published timetable (`kept`, course_id -> entries), so its teachers
+    stay busy there: the component is solved again with those entries reserved, until nothing new fails.
+    """
+    courses, busy, mode, optimize, kept = args
+    failed = {}
+    while True:
+        occupancy = busy.copy()
+        for course_id in failed:
+            _reserve_entries(occupancy, kept.get(course_id, ()))
+        results, new_failure = dict(failed), None
+        for course_id, sections, subjects, teacher_map in courses:
+            if course_id in failed:
+                continue
+            try:
+                entries = _schedule(sections, subjects, teacher_map, occupancy, mode, optimize)
+            except Exception as e:
+                new_failure = (course_id, str(e))
+                break
+            _reserve_entries(occupancy, entries)
+            results[course_id] = entries
+        if new_failure is None:
+            return results
+        failed[new_failure[0]] = new_failure[1]
+
+def _published_entries(cur, course_ids):
+    """Published entries of the given courses as course_id -> [(section, subject, teacher, day, start, end)]."""
+    course_ids = sorted(course_ids)
+    if not course_ids:
+        return {}
+    cur.execute(
+        'SELECT sec.course_id, t.section_id, t.subject_id, t.teacher_id, t.day_of_week, t.start_min, t.end_min '
+        'FROM timetable_entries t JOIN sections sec ON t.section_id=sec.id '
+        f"WHERE {PUBLISHED_ENTRIES} AND sec.course_id IN ({','.join(['%s'] * len(course_ids))})",
+        tuple(course_ids)
+    )
+    published = {}
+    for r in cur.fetchall():
+        published.setdefault(r['course_id'], []).append(
+            (r['section_id'], r['subject_id'], r['teacher_id'], r['day_of_week'], r['start_min'], r['end_min']))
+    return published
+
+def generate_all(mode: str = 'solver', optimize: bool = False, workers=None, progress=None) -> dict:
+    """
+    Semester-wide generation:
+    - Partition courses by shared teachers (course_components)
+    - Courses in one component are solved together, components in parallel processes
+    - All results are written in one transaction
+    - A course that fails keeps its published timetable, its teachers stay busy there
+    Returns {course_id: entry count or error message}.
+    """
+    mode = mode if mode in GENERATE_ALL_ENGINES else 'greedy'
+    progress = progress or (lambda phase, placed=None: None)
+    progress('loading constraints')
+    with db_cursor() as cur:
+        components = course_components(cur)
+
+    all_courses = [c for comp in components for c in comp]
+    with course_lock(*all_courses), db_cursor(commit=True) as cur:
+        loaded, summary = {}, {}
+        for course_id, model in load_constraints(cur, all_courses).items():
+            try:
+                loaded[course_id] = model.check()
+            except Exception as e:
+                summary[course_id] = str(e)
+
+        # Courses that could not be loaded keep their old entries, so teachers stay busy there
+        teacher_ids = [tid for model in loaded.values() for tid in model.teacher_ids()]
+        busy = merged_availability(loaded.values())
+        load_teacher_occupancy(cur, teacher_ids, occupancy=busy, exclude_course_ids=loaded)
+
+        # A course whose solve fails keeps these entries
+        kept = _published_entries(cur, loaded)
+        jobs = [([(c, loaded[c].sections, loaded[c].subjects, loaded[c].teacher_map) for c in comp if c in loaded],
+                 busy, mode, optimize, {c: kept.get(c, []) for c in comp}) for comp in components]
+        jobs = [job for job in jobs if job[0]]
+        workers = min(workers or GENERATION_WORKERS, len(jobs)) if jobs else 1
+        results, placed = [], 0
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=POOL_CONTEXT) if workers > 1 else None
+        try:
+            for result in (pool.map if pool else map)(_solve_component, jobs):
+                results.append(result)
+                placed += sum(len(e) for e in result.values() if not isinstance(e, str))
+                progress(f"solved {len(results)}/{len(jobs)} components", placed)
+        finally:
+            if pool:
+                pool.shutdown()
+
+        progress('saving', placed)
+        for result in results:
+            for course_id, entries in result.items():
+                if isinstance(entries, str):
+                    summary[course_id] = entries
+                    continue
+                _save_entries(cur, course_id, entries, source=f"all:{mode}")
+                summary[course_id] = len(entries)
+    _after_publish([c for c, n in summary.items() if not isinstance(n, str)])
+    return summary
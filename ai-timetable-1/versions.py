@@ -0,0 +1,135 @@
+import hashlib
+from db import bulk_insert, db_cursor
+from cache import read_through
+from config import TIMETABLE_KEEP_VERSIONS, TIMETABLE_RETENTION_DAYS
+
+ENTRY_COLUMNS = ('version_id', 'section_id', 'subject_id', 'teacher_id', 'day_of_week', 'start_min', 'end_min')
+
+# Readers only ever see published versions; `t` is the timetable_entries alias
+PUBLISHED_ENTRIES = 't.version_id IN (SELECT published_version_id FROM courses)'
+COURSE_ENTRIES = 't.version_id=(SELECT published_version_id FROM courses WHERE id=%s)'
+
+def create_version(cur, course_id, rows, source, copy_from=None, skip_ids=()):
+    """
+    Write an immutable timetable version (not yet visible to readers):
+    - rows are (section_id, subject_id, teacher_id, day, start_min, end_min)
+    - copy_from copies another version's entries server-side, except `skip_ids`
+    Returns the new version id.
+    """
+    cur.execute('INSERT INTO timetable_versions (course_id, source) VALUES (%s, %s)', (course_id, source))
+    version_id = cur.lastrowid
+    count = 0
+    if copy_from is not None:
+        skip_ids = sorted(skip_ids)
+        skip = f" AND id NOT IN ({','.join(['%s'] * len(skip_ids))})" if skip_ids else ''
+        cur.execute(
+            f'INSERT INTO timetable_entries ({",".join(ENTRY_COLUMNS)}) '
+            f'SELECT %s, {",".join(ENTRY_COLUMNS[1:])} FROM timetable_entries '
+            'WHERE version_id=%s' + skip,
+            (version_id, copy_from, *skip_ids)
+        )
+        count += cur.rowcount
+    count += bulk_insert(cur, 'timetable_entries', ENTRY_COLUMNS, [(version_id, *r) for r in rows])
+    cur.execute('UPDATE timetable_versions SET entry_count=%s WHERE id=%s', (count, version_id))
+    return version_id
+
+def publish_version(cur, course_id, version_id):
+    """Make `version_id` the course's live timetable: a single-row pointer update."""
+    cur.execute('UPDATE courses SET published_version_id=%s WHERE id=%s', (version_id, course_id))
+
+def published_version(cur, course_id):
+    cur.execute('SELECT published_version_id FROM courses WHERE id=%s', (course_id,))
+    row = cur.fetchone()
+    return row['published_version_id'] if row else None
+
+def list_versions(cur, course_id):
+    cur.execute(
+        'SELECT v.id, v.source, v.entry_count, v.created_at, (v.id = c.published_version_id) AS published '
+        'FROM timetable_versions v JOIN courses c ON v.course_id=c.id '
+        'WHERE v.course_id=%s ORDER BY v.id DESC',
+        (course_id,)
+    )
+    return cur.fetchall()
+
+def prune_versions(cur, course_ids, keep=None, retention_days=None):
+    """
+    Retention for old timetables, per course:
+    - The published version and the newest `keep` versions always stay
+    - Anything else older than `retention_days` is deleted (entries cascade)
+    The DELETE re-checks the published pointer itself, so a version re-published meanwhile
+    (e.g. by a rollback) is never deleted. Returns the number of versions deleted.
+    """
+    keep = TIMETABLE_KEEP_VERSIONS if keep is None else keep
+    retention_days = TIMETABLE_RETENTION_DAYS if retention_days is None else retention_days
+    deleted = 0
+    for course_id in course_ids:
+        cur.execute(
+            'SELECT v.id FROM timetable_versions v JOIN courses c ON v.course_id=c.id '
+            'WHERE v.course_id=%s AND v.id <> COALESCE(c.published_version_id, 0) '
+            'AND v.created_at < NOW() - INTERVAL %s DAY '
+            'ORDER BY v.id DESC',
+            (course_id, retention_days)
+        )
+        candidates = [r['id'] for r in cur.fetchall()]
+        cur.execute('SELECT id FROM timetable_versions WHERE course_id=%s ORDER BY id DESC LIMIT %s',
+                    (course_id, keep))
+        newest = {r['id'] for r in cur.fetchall()}
+        doomed = [v for v in candidates if v not in newest]
+        if doomed:
+            cur.execute(
+                f"DELETE FROM timetable_versions WHERE id IN ({','.join(['%s'] * len(doomed))}) "
+                'AND id <> (SELECT COALESCE(published_version_id, 0) FROM courses WHERE id=%s)',
+                (*doomed, course_id)
+            )
+            deleted += cur.rowcount
+    return deleted
+
+def course_timetable(course_id):
+    """
+    Published timetable of a course for display/export, cached per published version.
+    Rows are sorted by day and start; times are start_min/end_min (format with the |hhmm filter).
+    Pointer and rows are read on one connection (replica, or primary within the session's
+    read-your-writes window): one consistent snapshot, as publishing commits both together.
+    """
+    with db_cursor(read_only=True) as cur:
+        version_id = published_version(cur, course_id)
+        if version_id is None:
+            return []
+
+        def load():
+            cur.execute('''SELECT t.day_of_week, t.section_id, t.subject_id, t.teacher_id, t.start_min, t.end_min,
+                                  s.name AS subject_name, sec.name AS section_name, th.name AS teacher_name
+                           FROM timetable_entries t
+                           LEFT JOIN subjects s ON t.subject_id=s.id
+                           LEFT JOIN sections sec ON t.section_id=sec.id
+                           LEFT JOIN teachers th ON t.teacher_id=th.id
+                           WHERE t.version_id=%s
+                           ORDER BY t.day_of_week, t.start_min, sec.name''', (version_id,))
+            return cur.fetchall()
+        return read_through(f"course:{course_id}:v{version_id}", load)
+
+def published_versions_tag(cur):
+    """Short digest of every course's published version: changes whenever any course publishes or rolls back."""
+    cur.execute('SELECT id, published_version_id FROM courses ORDER BY id')
+    pairs = ','.join(f"{r['id']}:{r['published_version_id']}" for r in cur.fetchall())
+    return hashlib.sha1(pairs.encode('utf-8')).hexdigest()[:16]
+
+def teacher_timetable(teacher_id):
+    """
+    A teacher's published classes across all courses (same row format as course_timetable).
+    Cached per set of published versions, so every worker sees a publish at once, whatever the backend.
+    Versions and rows come from one connection, like course_timetable.
+    """
+    with db_cursor(read_only=True) as cur:
+        tag = published_versions_tag(cur)
+
+        def load():
+            cur.execute(f'''SELECT t.day_of_week, t.section_id, t.subject_id, t.teacher_id, t.start_min, t.end_min,
+                                   s.name AS subject_name, sec.name AS section_name
+                            FROM timetable_entries t
+                            LEFT JOIN subjects s ON t.subject_id=s.id
+                            LEFT JOIN sections sec ON t.section_id=sec.id
+                            WHERE t.teacher_id=%s AND {PUBLISHED_ENTRIES}
+                            ORDER BY t.day_of_week, t.start_min, sec.name''', (teacher_id,))
+            return cur.fetchall()
+        return read_through(f"teacher:{teacher_id}:p{tag}", load)